@@ -0,0 +1,155 @@
+import json
+from datetime import date
+from typing import Optional
+
+import anthropic
+
+from agent.classifier import parse_hsa_result
+from agent.extractor import parse_extracted_data
+from agent.prompts import BATCH_CLASSIFICATION_PROMPT, BATCH_COMBINED_PROMPT
+from agent.rate_limiter import RateLimiter, create_message, pdf_page_count
+from agent.request_builder import (
+    DocumentPart,
+    build_content_blocks,
+    build_system,
+    log_usage,
+    parse_json_response,
+)
+from models.data_models import ExtractedData, HSAResult
+from utils.logger import get_logger
+from utils.result_cache import ResultCache
+
+logger = get_logger(__name__)
+
+TOKENS_PER_DOCUMENT = {False: 256, True: 384}   # max_tokens per answer object
+MAX_PARTS = 100                                  # images/documents the API accepts per request
+MAX_PDF_PAGES = 100                              # PDF pages the API accepts per request
+
+
+class BatchClassifier:
+    """Classifies every document of one email in a single Claude call.
+
+    Each document is introduced by a "Document N" label and Claude answers
+    with a JSON array, one object per document in order. With `extract`
+    the call also extracts date, item and amount, like CombinedAnalyzer.
+
+    Returns None, so the caller can classify one document at a time, when
+    the documents exceed `max_bytes` / `max_documents` or the API's part or
+    PDF page limit, when the API rejects the combined request anyway, or
+    when the answer doesn't have one usable object per document.
+
+    If a ResultCache is given, identical sets of documents are answered
+    from it. Calls go through the shared RateLimiter, if given.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        cache: ResultCache | None = None,
+        limiter: RateLimiter | None = None,
+        client: anthropic.Anthropic | None = None,
+        extract: bool = False,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_documents: int = 10,
+    ):
+        self.client = client or anthropic.Anthropic(api_key=api_key)
+        self.model = model
+        self.cache = cache
+        self.limiter = limiter
+        self.extract = extract
+        self.max_bytes = max_bytes
+        self.max_documents = max_documents
+        self.prompt = BATCH_COMBINED_PROMPT if extract else BATCH_CLASSIFICATION_PROMPT
+
+    def classify_documents(
+        self, documents: list[list[DocumentPart]], fallback_date: date
+    ) -> Optional[list[tuple[HSAResult, Optional[ExtractedData]]]]:
+        """(HSAResult, ExtractedData or None) per document, in order, or None to fall back."""
+        total_bytes = sum(len(content) for parts in documents for content, _ in parts)
+        part_count = sum(len(parts) for parts in documents)
+        pdf_pages = sum(
+            pdf_page_count(content) for parts in documents for content, mime_type in parts
+            if mime_type == "application/pdf"
+        )
+        if (
+            len(documents) > self.max_documents
+            or total_bytes > self.max_bytes
+            or part_count > MAX_PARTS
+            or pdf_pages > MAX_PDF_PAGES
+        ):
+            logger.info(
+                f"{len(documents)} document(s), {part_count} part(s), {pdf_pages} PDF page(s), "
+                f"{total_bytes} bytes is too much for one request — classifying one at a time"
+            )
+            return None
+
+        logger.info(f"Classifying {len(documents)} documents in one request ({total_bytes} bytes)")
+        labelled: list[DocumentPart] = []
+        content: list[dict] = []
+        for number, parts in enumerate(documents, start=1):
+            label = f"Document {number}"
+            labelled += [(label.encode("utf-8"), "text/x-label"), *parts]
+            content += [{"type": "text", "text": label}, *build_content_blocks(parts)]
+
+        cache_key = None
+        if self.cache:
+            kind = "batch_combined" if self.extract else "batch"
+            cache_key = ResultCache.make_key(kind, self.model, self.prompt, labelled)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Batch result served from cache")
+                return self._parse(cached, len(documents), fallback_date)
+
+        try:
+            response = create_message(
+                self.client,
+                self.limiter,
+                model=self.model,
+                max_tokens=TOKENS_PER_DOCUMENT[self.extract] * len(documents),
+                system=build_system(self.prompt),
+                messages=[{"role": "user", "content": content}],
+            )
+        except anthropic.APIStatusError as e:
+            # e.g. a limit the pre-check doesn't know about; each document
+            # alone may still be accepted
+            if e.status_code not in (400, 413):
+                raise
+            logger.warning(f"Batch request rejected ({e.status_code}): {e} — classifying one at a time")
+            return None
+        log_usage("Batch classifier", response.usage)
+
+        raw = response.content[0].text
+        logger.debug(f"Batch classifier raw response: {raw}")
+
+        try:
+            data = parse_json_response(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Failed to parse batch response: {e} — raw: {raw}")
+            return None
+        results = self._parse(data, len(documents), fallback_date)
+        if results is not None and cache_key:
+            self.cache.put(cache_key, data)
+        return results
+
+    def _parse(
+        self, data, count: int, fallback_date: date
+    ) -> Optional[list[tuple[HSAResult, Optional[ExtractedData]]]]:
+        if not isinstance(data, list) or len(data) != count:
+            logger.warning(f"Batch response has {len(data) if isinstance(data, list) else 'no'} answers for {count} documents")
+            return None
+        try:
+            results = [
+                (parse_hsa_result(item), parse_extracted_data(item, fallback_date) if self.extract else None)
+                for item in data
+            ]
+        except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+            logger.warning(f"Failed to parse batch response: {e}")
+            return None
+
+        for number, (result, _) in enumerate(results, start=1):
+            logger.info(
+                f"Document {number}: eligible={result.is_hsa_eligible} "
+                f"confidence={result.confidence:.2f} reason='{result.reason}'"
+            )
+        return results
@@ -0,0 +1,76 @@
+import threading
+from collections import Counter
+from datetime import date
+
+from agent.classifier import Classifier
+from agent.extractor import Extractor
+from agent.request_builder import DocumentPart
+from models.data_models import ExtractedData, HSAResult
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+FAST = "fast"
+STRONG = "strong"
+
+
+class ModelCascade:
+    """Asks a small, fast model first and the large model only when needed.
+
+    Classification escalates when the fast model's confidence is within
+    `band` of the confidence threshold, on either side and for either
+    verdict: those are the answers most likely to flip, as are answers
+    that can't be parsed, which the small model is likelier to give.
+    Extraction escalates when the fast model finds no amount or no item name.
+
+    Both methods return which tier gave the answer ("fast" or "strong"),
+    and stats() counts them, so the band can be tuned for cost and latency.
+    """
+
+    def __init__(
+        self,
+        fast_classifier: Classifier,
+        fast_extractor: Extractor,
+        strong_classifier: Classifier,
+        strong_extractor: Extractor,
+        threshold: float,
+        band: float = 0.15,
+    ):
+        self.fast_classifier = fast_classifier
+        self.fast_extractor = fast_extractor
+        self.strong_classifier = strong_classifier
+        self.strong_extractor = strong_extractor
+        self.threshold = threshold
+        self.band = band
+        self._decided = Counter()
+        self._lock = threading.Lock()
+
+    def classify_parts(self, parts: list[DocumentPart]) -> tuple[HSAResult, str]:
+        result = self.fast_classifier.classify_parts(parts)
+        if result.parse_error:
+            logger.info(f"Fast model answer was unusable — asking {self.strong_classifier.model}")
+        elif abs(result.confidence - self.threshold) > self.band:
+            return result, self._count("classify", FAST)
+        else:
+            logger.info(
+                f"Fast model confidence {result.confidence:.2f} is within {self.band} of the "
+                f"{self.threshold} threshold — asking {self.strong_classifier.model}"
+            )
+        return self.strong_classifier.classify_parts(parts), self._count("classify", STRONG)
+
+    def extract_parts(self, parts: list[DocumentPart], fallback_date: date) -> tuple[ExtractedData, str]:
+        extracted = self.fast_extractor.extract_parts(parts, fallback_date)
+        if extracted.amount is not None and extracted.item_name != "Unknown item":
+            return extracted, self._count("extract", FAST)
+
+        logger.info(f"Fast model left fields empty — asking {self.strong_extractor.model}")
+        return self.strong_extractor.extract_parts(parts, fallback_date), self._count("extract", STRONG)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._decided)
+
+    def _count(self, step: str, tier: str) -> str:
+        with self._lock:
+            self._decided[f"{step}_{tier}"] += 1
+        return tier
@@ -1,11 +1,20 @@
-import base64
 import json
 
 import anthropic
 
 from agent.prompts import CLASSIFICATION_PROMPT
+from agent.rate_limiter import RateLimiter, create_message
+from agent.request_builder import (
+    DocumentPart,
+    build_content_blocks,
+    build_system,
+    describe_parts,
+    log_usage,
+    parse_json_response,
+)
 from models.data_models import HSAResult
 from utils.logger import get_logger
+from utils.result_cache import ResultCache
 
 logger = get_logger(__name__)
 
@@ -13,79 +22,86 @@ logger = get_logger(__name__)
 class Classifier:
     """Sends an email screenshot or PDF to Claude and asks:
     'Is there an HSA-eligible expense in this document?'
+
+    If a ResultCache is given, identical documents are answered from it.
+    Calls go through the shared RateLimiter, if given.
     """
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        cache: ResultCache | None = None,
+        limiter: RateLimiter | None = None,
+        client: anthropic.Anthropic | None = None,
+    ):
+        # Pass the shared client from agent.client_factory to reuse its connections
+        self.client = client or anthropic.Anthropic(api_key=api_key)
         self.model = model
+        self.cache = cache
+        self.limiter = limiter
 
     def classify(self, content: bytes, mime_type: str) -> HSAResult:
         """Classify a single image or PDF.
 
         Args:
-            content:   Raw bytes of a PNG screenshot or PDF.
-            mime_type: Either "image/png" or "application/pdf".
+            content:   Raw bytes of a PNG screenshot, PDF, or UTF-8 text.
+            mime_type: "image/png", "application/pdf", or "text/plain".
 
         Returns:
             HSAResult with is_hsa_eligible, confidence, and reason.
         """
-        logger.info(f"Classifying document ({mime_type}, {len(content)} bytes)")
-
-        encoded = base64.standard_b64encode(content).decode("utf-8")
-
-        if mime_type == "application/pdf":
-            content_block = {
-                "type": "document",
-                "source": {
-                    "type": "base64",
-                    "media_type": "application/pdf",
-                    "data": encoded,
-                },
-            }
-        else:
-            content_block = {
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": mime_type,
-                    "data": encoded,
-                },
-            }
-
-        response = self.client.messages.create(
+        return self.classify_parts([(content, mime_type)])
+
+    def classify_parts(self, parts: list[DocumentPart]) -> HSAResult:
+        """Classify one document sent as several parts (e.g. screenshot tiles)."""
+        logger.info(f"Classifying document ({describe_parts(parts)})")
+
+        cache_key = None
+        if self.cache:
+            cache_key = ResultCache.make_key("classify", self.model, CLASSIFICATION_PROMPT, parts)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                result = parse_hsa_result(cached)
+                logger.info(
+                    f"Classification result (cached): eligible={result.is_hsa_eligible} "
+                    f"confidence={result.confidence:.2f} reason='{result.reason}'"
+                )
+                return result
+
+        response = create_message(
+            self.client,
+            self.limiter,
             model=self.model,
             max_tokens=256,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        content_block,
-                        {"type": "text", "text": CLASSIFICATION_PROMPT},
-                    ],
-                }
-            ],
+            system=build_system(CLASSIFICATION_PROMPT),
+            messages=[{"role": "user", "content": build_content_blocks(parts)}],
         )
+        log_usage("Classifier", response.usage)
 
-        import re
-        raw = response.content[0].text.strip()
-        raw = re.sub(r"^```[a-z]*\s*", "", raw)
-        raw = re.sub(r"\s*```$", "", raw)
-        raw = raw.strip()
+        raw = response.content[0].text
         logger.debug(f"Classifier raw response: {raw}")
 
         try:
-            data = json.loads(raw)
-            result = HSAResult(
-                is_hsa_eligible=bool(data["is_hsa_eligible"]),
-                confidence=float(data["confidence"]),
-                reason=str(data.get("reason", "")),
-            )
+            data = parse_json_response(raw)
+            result = parse_hsa_result(data)
+            if cache_key:
+                self.cache.put(cache_key, data)
         except (json.JSONDecodeError, KeyError) as e:
             logger.error(f"Failed to parse classifier response: {e} — raw: {raw}")
-            result = HSAResult(is_hsa_eligible=False, confidence=0.0, reason="Parse error")
+            result = HSAResult(is_hsa_eligible=False, confidence=0.0, reason="Parse error", parse_error=True)
 
         logger.info(
             f"Classification result: eligible={result.is_hsa_eligible} "
             f"confidence={result.confidence:.2f} reason='{result.reason}'"
         )
         return result
+
+
+def parse_hsa_result(data: dict) -> HSAResult:
+    """Build an HSAResult from Claude's parsed JSON. Raises KeyError on missing fields."""
+    return HSAResult(
+        is_hsa_eligible=bool(data["is_hsa_eligible"]),
+        confidence=float(data["confidence"]),
+        reason=str(data.get("reason", "")),
+    )
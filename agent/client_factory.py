@@ -0,0 +1,111 @@
+import threading
+import time
+
+import anthropic
+import httpx
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CONNECT_TIMEOUT_SECONDS = 10
+DEFAULT_TIMEOUT_SECONDS = 600    # the SDK's own default; large PDFs and images can take minutes
+KEEPALIVE_EXPIRY_SECONDS = 60    # idle connections kept warm between emails
+
+# httpcore trace events bracketing a new connection's TCP connect and TLS handshake
+_TRACE_CONNECT_STARTED = "connection.connect_tcp.started"
+_TRACE_CONNECT_DONE = "connection.start_tls.complete"
+
+
+class ConnectionStats:
+    """Counts new connections vs requests, and the time spent on each.
+
+    Connect time is TCP + TLS for a new connection (from httpcore's trace
+    events); request time runs from sending the request to receiving the
+    response headers, so it includes connect time when one was needed.
+    """
+
+    def __init__(self):
+        self.connects = 0
+        self.requests = 0
+        self.connect_seconds = 0.0
+        self.request_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.connects,
+                "reused": max(0, self.requests - self.connects),
+                "avg_connect_ms": round(1000 * self.connect_seconds / self.connects) if self.connects else 0,
+                "avg_request_ms": round(1000 * self.request_seconds / self.requests) if self.requests else 0,
+            }
+
+    def _trace(self):
+        started = {}
+
+        def trace(name: str, info: dict) -> None:
+            if name == _TRACE_CONNECT_STARTED:
+                started["at"] = time.monotonic()
+            elif name == _TRACE_CONNECT_DONE and "at" in started:
+                with self._lock:
+                    self.connects += 1
+                    self.connect_seconds += time.monotonic() - started.pop("at")
+        return trace
+
+    def on_request(self, request: httpx.Request) -> None:
+        request.extensions["trace"] = self._trace()
+        request.extensions["started_at"] = time.monotonic()
+
+    def on_response(self, response: httpx.Response) -> None:
+        started = response.request.extensions.get("started_at")
+        if started is not None:
+            with self._lock:
+                self.requests += 1
+                self.request_seconds += time.monotonic() - started
+
+
+connection_stats = ConnectionStats()
+
+_clients: dict[tuple, anthropic.Anthropic] = {}
+_lock = threading.Lock()
+
+
+def get_client(api_key: str, timeout: float = DEFAULT_TIMEOUT_SECONDS, max_connections: int = 16) -> anthropic.Anthropic:
+    """The process-wide Anthropic client for this key.
+
+    Every Classifier, Extractor and CombinedAnalyzer shares it, so they
+    share one keep-alive connection pool: after the first call, requests
+    go out on an already-open TLS connection.
+    """
+    key = (api_key, timeout, max_connections)
+    with _lock:
+        if key not in _clients:
+            _clients[key] = anthropic.Anthropic(
+                api_key=api_key,
+                http_client=anthropic.DefaultHttpxClient(
+                    limits=_limits(max_connections),
+                    timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT_SECONDS),
+                    event_hooks={"request": [connection_stats.on_request], "response": [connection_stats.on_response]},
+                ),
+            )
+            logger.debug(f"Created Anthropic client (pool of {max_connections}, timeout {timeout}s)")
+        return _clients[key]
+
+
+def close_clients() -> None:
+    """Close every pooled connection (at shutdown)."""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+    logger.info(f"Claude connections: {connection_stats.snapshot()}")
+
+
+def _limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+    )
@@ -0,0 +1,110 @@
+import json
+from datetime import date
+from typing import Optional
+
+import anthropic
+
+from agent.classifier import parse_hsa_result
+from agent.extractor import parse_extracted_data
+from agent.prompts import COMBINED_PROMPT
+from agent.rate_limiter import RateLimiter, create_message
+from agent.request_builder import (
+    DocumentPart,
+    build_content_blocks,
+    build_system,
+    describe_parts,
+    log_usage,
+    parse_json_response,
+)
+from models.data_models import ExtractedData, HSAResult
+from utils.logger import get_logger
+from utils.result_cache import ResultCache
+
+logger = get_logger(__name__)
+
+
+class CombinedAnalyzer:
+    """Classifies and extracts in a single Claude call.
+
+    Sends the document once instead of twice, halving upload bytes, input
+    tokens and latency for eligible receipts. Returns None when the answer
+    can't be parsed so the caller can fall back to Classifier + Extractor.
+
+    If a ResultCache is given, identical documents are answered from it.
+    Calls go through the shared RateLimiter, if given.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        cache: ResultCache | None = None,
+        limiter: RateLimiter | None = None,
+        client: anthropic.Anthropic | None = None,
+    ):
+        # Pass the shared client from agent.client_factory to reuse its connections
+        self.client = client or anthropic.Anthropic(api_key=api_key)
+        self.model = model
+        self.cache = cache
+        self.limiter = limiter
+
+    def analyze(
+        self, content: bytes, mime_type: str, fallback_date: date
+    ) -> Optional[tuple[HSAResult, ExtractedData]]:
+        """Classify an image or PDF and extract its date, item and amount.
+
+        Args:
+            content:       Raw bytes of a PNG screenshot, PDF, or UTF-8 text.
+            mime_type:     "image/png", "application/pdf", or "text/plain".
+            fallback_date: The email received date — used if Claude
+                           cannot find the purchase date in the document.
+
+        Returns:
+            (HSAResult, ExtractedData), or None if the response was unusable.
+        """
+        return self.analyze_parts([(content, mime_type)], fallback_date)
+
+    def analyze_parts(
+        self, parts: list[DocumentPart], fallback_date: date
+    ) -> Optional[tuple[HSAResult, ExtractedData]]:
+        """Analyze one document sent as several parts (e.g. screenshot tiles)."""
+        logger.info(f"Classifying and extracting document ({describe_parts(parts)})")
+
+        cache_key = None
+        if self.cache:
+            cache_key = ResultCache.make_key("combined", self.model, COMBINED_PROMPT, parts)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Combined result served from cache")
+                return parse_hsa_result(cached), parse_extracted_data(cached, fallback_date)
+
+        response = create_message(
+            self.client,
+            self.limiter,
+            model=self.model,
+            max_tokens=384,
+            system=build_system(COMBINED_PROMPT),
+            messages=[{"role": "user", "content": build_content_blocks(parts)}],
+        )
+        log_usage("Combined analyzer", response.usage)
+
+        raw = response.content[0].text
+        logger.debug(f"Combined raw response: {raw}")
+
+        try:
+            data = parse_json_response(raw)
+            result = parse_hsa_result(data)
+            extracted = parse_extracted_data(data, fallback_date)
+            if cache_key:
+                self.cache.put(cache_key, data)
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, ArithmeticError) as e:
+            # e.g. a non-numeric confidence, or an amount like "$12.50"
+            logger.warning(f"Failed to parse combined response: {e} — raw: {raw}")
+            return None
+
+        logger.info(
+            f"Combined result: eligible={result.is_hsa_eligible} "
+            f"confidence={result.confidence:.2f} reason='{result.reason}' "
+            f"date={extracted.purchase_date} item='{extracted.item_name}' amount={extracted.amount}"
+        )
+        return result, extracted
@@ -1,4 +1,3 @@
-import base64
 import json
 from datetime import date, datetime
 from decimal import Decimal
@@ -6,8 +5,18 @@ from decimal import Decimal
 import anthropic
 
 from agent.prompts import EXTRACTION_PROMPT
+from agent.rate_limiter import RateLimiter, create_message
+from agent.request_builder import (
+    DocumentPart,
+    build_content_blocks,
+    build_system,
+    describe_parts,
+    log_usage,
+    parse_json_response,
+)
 from models.data_models import ExtractedData
 from utils.logger import get_logger
+from utils.result_cache import ResultCache
 
 logger = get_logger(__name__)
 
@@ -17,90 +26,99 @@ class Extractor:
     - Date of purchase
     - Item / service name
     - Total amount
+
+    If a ResultCache is given, identical documents are answered from it.
+    Calls go through the shared RateLimiter, if given.
     """
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        cache: ResultCache | None = None,
+        limiter: RateLimiter | None = None,
+        client: anthropic.Anthropic | None = None,
+    ):
+        # Pass the shared client from agent.client_factory to reuse its connections
+        self.client = client or anthropic.Anthropic(api_key=api_key)
         self.model = model
+        self.cache = cache
+        self.limiter = limiter
 
     def extract(self, content: bytes, mime_type: str, fallback_date: date) -> ExtractedData:
         """Extract structured data from an HSA receipt image or PDF.
 
         Args:
-            content:       Raw bytes of a PNG screenshot or PDF.
-            mime_type:     Either "image/png" or "application/pdf".
+            content:       Raw bytes of a PNG screenshot, PDF, or UTF-8 text.
+            mime_type:     "image/png", "application/pdf", or "text/plain".
             fallback_date: The email received date — used if Claude
                            cannot find the purchase date in the document.
 
         Returns:
             ExtractedData with purchase_date, item_name, and amount.
         """
-        logger.info(f"Extracting data from document ({mime_type})")
-
-        encoded = base64.standard_b64encode(content).decode("utf-8")
-
-        if mime_type == "application/pdf":
-            content_block = {
-                "type": "document",
-                "source": {
-                    "type": "base64",
-                    "media_type": "application/pdf",
-                    "data": encoded,
-                },
-            }
-        else:
-            content_block = {
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": mime_type,
-                    "data": encoded,
-                },
-            }
-
-        response = self.client.messages.create(
+        return self.extract_parts([(content, mime_type)], fallback_date)
+
+    def extract_parts(self, parts: list[DocumentPart], fallback_date: date) -> ExtractedData:
+        """Extract from one document sent as several parts (e.g. screenshot tiles)."""
+        logger.info(f"Extracting data from document ({describe_parts(parts)})")
+
+        cache_key = None
+        if self.cache:
+            cache_key = ResultCache.make_key("extract", self.model, EXTRACTION_PROMPT, parts)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                result = parse_extracted_data(cached, fallback_date)
+                logger.info(
+                    f"Extracted (cached): date={result.purchase_date} "
+                    f"item='{result.item_name}' amount={result.amount}"
+                )
+                return result
+
+        response = create_message(
+            self.client,
+            self.limiter,
             model=self.model,
             max_tokens=256,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        content_block,
-                        {"type": "text", "text": EXTRACTION_PROMPT},
-                    ],
-                }
-            ],
+            system=build_system(EXTRACTION_PROMPT),
+            messages=[{"role": "user", "content": build_content_blocks(parts)}],
         )
+        log_usage("Extractor", response.usage)
 
-        import re
-        raw = response.content[0].text.strip()
-        raw = re.sub(r"^```[a-z]*\s*", "", raw)
-        raw = re.sub(r"\s*```$", "", raw)
-        raw = raw.strip()
+        raw = response.content[0].text
         logger.debug(f"Extractor raw response: {raw}")
 
         try:
-            data = json.loads(raw)
-
-            # Parse date — fall back to email received date if null or invalid
-            purchase_date = fallback_date
-            if data.get("purchase_date"):
-                try:
-                    purchase_date = datetime.strptime(data["purchase_date"], "%Y-%m-%d").date()
-                except ValueError:
-                    logger.warning(f"Could not parse date '{data['purchase_date']}' — using email date")
-
-            item_name = data.get("item_name") or "Unknown item"
-            amount = Decimal(str(data["amount"])) if data.get("amount") is not None else None
-
+            data = parse_json_response(raw)
+            result = parse_extracted_data(data, fallback_date)
+            if cache_key:
+                self.cache.put(cache_key, data)
         except (json.JSONDecodeError, KeyError) as e:
             logger.error(f"Failed to parse extractor response: {e} — raw: {raw}")
             return ExtractedData(purchase_date=fallback_date, item_name="Unknown item", amount=None)
 
-        result = ExtractedData(
-            purchase_date=purchase_date,
-            item_name=item_name,
-            amount=amount,
-        )
         logger.info(f"Extracted: date={result.purchase_date} item='{result.item_name}' amount={result.amount}")
         return result
+
+
+def parse_extracted_data(data: dict, fallback_date: date) -> ExtractedData:
+    """Build ExtractedData from Claude's parsed JSON.
+
+    The purchase date falls back to the email received date if it is
+    null or can't be parsed; a missing item becomes "Unknown item".
+    """
+    purchase_date = fallback_date
+    if data.get("purchase_date"):
+        try:
+            purchase_date = datetime.strptime(data["purchase_date"], "%Y-%m-%d").date()
+        except ValueError:
+            logger.warning(f"Could not parse date '{data['purchase_date']}' — using email date")
+
+    item_name = data.get("item_name") or "Unknown item"
+    amount = Decimal(str(data["amount"])) if data.get("amount") is not None else None
+
+    return ExtractedData(
+        purchase_date=purchase_date,
+        item_name=item_name,
+        amount=amount,
+    )
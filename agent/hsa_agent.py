@@ -1,14 +1,28 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parseaddr
+
 from config import Settings
+from agent.batch_classifier import BatchClassifier
+from agent.cascade import STRONG, ModelCascade
 from agent.classifier import Classifier
+from agent.client_factory import close_clients, get_client
+from agent.combined_analyzer import CombinedAnalyzer
 from agent.extractor import Extractor
-from capture.pdf_handler import extract_pdfs
-from capture.screenshot import render_email_to_screenshot
+from agent.prefilter import PreFilter
+from agent.rate_limiter import RateLimiter
+from capture.html_text import html_to_text
+from capture.image_prep import prepare_image
+from capture.pdf_handler import extract_pdfs, extract_text_layer, is_text_layer_usable, trim_pdf
+from capture.screenshot import ScreenshotRenderer, render_email_to_screenshot
 from google_services.drive_client import DriveClient
+from google_services.sheets_batch_writer import SheetsBatchWriter
 from google_services.sheets_client import SheetsClient
-from models.data_models import EmailMessage, SheetRow
+from models.data_models import Capture, EmailMessage, HSAResult, SheetRow
 from utils.dedup_store import DedupStore
+from utils.asset_cache import AssetCache
 from utils.filename_formatter import format_filename
 from utils.logger import get_logger
+from utils.result_cache import ResultCache
 
 logger = get_logger(__name__)
 
@@ -16,28 +30,95 @@ logger = get_logger(__name__)
 class HSAAgent:
     """Orchestrates the full pipeline for a single email:
 
-    1. Skip if already processed
-    2. Capture — extract PDF or render screenshot
+    1. Skip if already processed, or if the local pre-filter is sure it isn't HSA mail
+    2. Capture — extract PDF, render screenshot, or (text-first) email text
     3. Classify — ask Claude if HSA-eligible
     4. Extract — ask Claude for date, item, amount
     5. Upload — save file to Google Drive
     6. Log — append row to Google Sheet
     7. Mark as processed in dedup store
+
+    Each step is also exposed as its own method so that agent.pipeline.Pipeline
+    can run them on separate worker pools.
     """
 
     def __init__(
         self,
         settings: Settings,
         drive_client: DriveClient,
-        sheets_client: SheetsClient,
+        sheets_client: SheetsClient | SheetsBatchWriter,
         dedup_store: DedupStore,
+        result_cache: ResultCache | None = None,
+        prefilter: PreFilter | None = None,
     ):
         self.settings = settings
-        self.classifier = Classifier(api_key=settings.anthropic_api_key, model=settings.claude_model)
-        self.extractor = Extractor(api_key=settings.anthropic_api_key, model=settings.claude_model)
+        self.prefilter = prefilter
+        self.result_cache = result_cache
+        # One limiter for every Claude call, however many pipeline workers make them
+        self.limiter = RateLimiter(
+            requests_per_minute=settings.claude_requests_per_minute,
+            input_tokens_per_minute=settings.claude_input_tokens_per_minute,
+            output_tokens_per_minute=settings.claude_output_tokens_per_minute,
+            max_concurrency=settings.claude_max_concurrency,
+        )
+        # ...and one pooled client, so every call reuses warm connections
+        client = get_client(
+            settings.anthropic_api_key,
+            timeout=settings.claude_timeout_seconds,
+            max_connections=settings.claude_max_connections,
+        )
+        claude = dict(
+            api_key=settings.anthropic_api_key,
+            model=settings.claude_model,
+            cache=result_cache,
+            limiter=self.limiter,
+            client=client,
+        )
+        self.classifier = Classifier(**claude)
+        self.extractor = Extractor(**claude)
+        self.combined = CombinedAnalyzer(**claude) if settings.combined_mode else None
+        self.batch = (
+            BatchClassifier(
+                **claude,
+                extract=settings.batch_extract,
+                max_bytes=settings.batch_max_mb * 1024 * 1024,
+                max_documents=settings.batch_max_documents,
+            )
+            if settings.batch_classify else None
+        )
+        self.cascade = None
+        if settings.claude_fast_model:
+            fast = {**claude, "model": settings.claude_fast_model}
+            self.cascade = ModelCascade(
+                fast_classifier=Classifier(**fast),
+                fast_extractor=Extractor(**fast),
+                strong_classifier=self.classifier,
+                strong_extractor=self.extractor,
+                threshold=settings.hsa_confidence_threshold,
+                band=settings.cascade_band,
+            )
+        self._asset_cache = (
+            AssetCache(settings.asset_cache_dir, max_bytes=settings.asset_cache_max_mb * 1024 * 1024)
+            if settings.screenshot_offline else None
+        )
+        self.renderer = (
+            ScreenshotRenderer(
+                pool_size=settings.screenshot_pool_size,
+                recycle_after=settings.screenshot_recycle_after,
+                offline=settings.screenshot_offline,
+                asset_cache=self._asset_cache,
+                budget_seconds=settings.screenshot_budget_seconds,
+            )
+            if settings.screenshot_pool_size > 0 else None
+        )
         self.drive_client = drive_client
         self.sheets_client = sheets_client
         self.dedup = dedup_store
+        # Extractions started alongside classification for likely receipts
+        self._speculator = (
+            ThreadPoolExecutor(max_workers=settings.speculative_workers, thread_name_prefix="speculative-extract")
+            if settings.speculative_extraction != "off" and not self.combined else None
+        )
 
     def process(self, message: EmailMessage) -> None:
         """Process a single incoming email message."""
@@ -47,72 +128,236 @@ class HSAAgent:
         if self.dedup.already_processed(message.message_id):
             logger.info(f"Already processed — skipping: {message.message_id}")
             return
+        if self.prefiltered(message):
+            return
 
         # ── Step 2: Capture ──────────────────────────────────────────────
-        # Prefer attached PDFs; fall back to HTML screenshot
-        captures: list[tuple[bytes, str]] = []  # (content, mime_type)
+        captures = self.capture(message)
+        if not captures:
+            return
+
+        # ── Steps 3–6: Classify → Extract → Upload → Log ────────────────
+        any_eligible = False
+        for capture, accepted in zip(captures, self.classify_all(captures, message)):
+            if not accepted:
+                continue
+            any_eligible = True
+            if not self.extract(capture, message):
+                continue
+            self.upload(capture, message)
+            self.log(capture)
+
+        # ── Step 7: Mark as processed ────────────────────────────────────
+        self.finish(message, any_eligible)
+
+    # ── Individual steps ─────────────────────────────────────────────────
+
+    def prefiltered(self, message: EmailMessage) -> bool:
+        """Step 1: True (and marked processed) if the pre-filter skips the email."""
+        if not self.prefilter or not self.prefilter.should_skip(message):
+            return False
+        self.dedup.mark_processed(message.message_id)
+        return True
 
+    def capture(self, message: EmailMessage) -> list[Capture]:
+        """Step 2: prefer attached PDFs; fall back to an HTML screenshot.
+
+        In text-first mode an email without PDFs is captured as its visible
+        text, and the screenshot is only rendered later if the email turns
+        out to be an HSA receipt (see _ensure_rendered).
+
+        In PDF text mode, a PDF with a good text layer is sent to Claude as
+        that text. Otherwise long PDFs are trimmed to their most relevant
+        pages for Claude; Drive always gets the original file.
+
+        Returns an empty list if nothing could be captured, in which case
+        the email is left unmarked so it can be retried later.
+        """
         pdfs = extract_pdfs(message)
         if pdfs:
             logger.info(f"Using {len(pdfs)} PDF attachment(s)")
-            for pdf in pdfs:
-                captures.append((pdf, "application/pdf"))
+            return [self._capture_pdf(pdf) for pdf in pdfs]
+
+        if self.settings.text_first_mode:
+            text = html_to_text(message.body_html) if message.body_html else message.body_text.strip()
+            if len(text) >= self.settings.text_first_min_chars:
+                logger.info(f"No PDF found — classifying email text first ({len(text)} chars)")
+                header = f"From: {message.from_address}\nSubject: {message.subject}\n\n"
+                return [Capture(
+                    content=b"",
+                    mime_type="image/png",
+                    llm_parts=[((header + text).encode("utf-8"), "text/plain")],
+                )]
+            logger.info(f"Email text too short ({len(text)} chars) for text-first — rendering")
+
+        logger.info("No PDF found — rendering email as screenshot")
+        try:
+            screenshot = self._render(message.body_html, message.body_text)
+        except Exception as e:
+            logger.error(f"Screenshot failed: {e} — skipping email")
+            return []
+        return [Capture(content=screenshot, mime_type="image/png", llm_parts=self._prepare_image(screenshot))]
+
+    def classify_all(self, captures: list[Capture], message: EmailMessage) -> list[bool]:
+        """Step 3 for every capture of an email: which ones should be extracted.
+
+        In batch mode an email with several documents is classified (and, with
+        batch_extract, extracted) in one Claude call; if the documents are too
+        big for one request or the answer is unusable, each is classified alone.
+        """
+        if self.batch and len(captures) > 1:
+            results = self.batch.classify_documents([c.payload for c in captures], fallback_date=message.date)
+            if results is not None:
+                for capture, (result, extracted) in zip(captures, results):
+                    capture.result = result
+                    capture.tiers["classify"] = STRONG
+                    if extracted is not None:
+                        capture.extracted = extracted
+                        capture.tiers["extract"] = STRONG
+                return [self._accept(capture.result) for capture in captures]
+        return [self.classify(capture, message) for capture in captures]
+
+    def classify(self, capture: Capture, message: EmailMessage) -> bool:
+        """Step 3: classify the capture. Returns True if it should be extracted.
+
+        In combined mode this also fills capture.extracted from the same
+        Claude call, falling back to the separate classifier if the combined
+        answer can't be parsed.
+
+        With speculative extraction on, extraction of a likely receipt (see
+        _is_likely_receipt) starts at the same time, so an eligible document
+        costs one round trip of latency instead of two. If the answer is no,
+        the extraction is cancelled, or its result dropped if already running.
+        """
+        if self._speculator and self._is_likely_receipt(capture, message):
+            logger.info("Likely receipt — starting extraction alongside classification")
+            capture.speculative = self._speculator.submit(self._extract_parts, capture, message)
+
+        accepted = False
+        try:
+            accepted = self._classify(capture, message)
+        finally:
+            if not accepted and capture.speculative:
+                if not capture.speculative.cancel():
+                    logger.info("Dropping speculative extraction of a rejected document")
+                capture.speculative = None
+        return accepted
+
+    def _classify(self, capture: Capture, message: EmailMessage) -> bool:
+        combined = None
+        if self.combined:
+            combined = self.combined.analyze_parts(capture.payload, fallback_date=message.date)
+
+        if combined:
+            result, capture.extracted = combined
+            capture.tiers["classify"] = capture.tiers["extract"] = STRONG
+        elif self.cascade:
+            result, capture.tiers["classify"] = self.cascade.classify_parts(capture.payload)
         else:
-            logger.info("No PDF found — rendering email as screenshot")
+            result = self.classifier.classify_parts(capture.payload)
+            capture.tiers["classify"] = STRONG
+        capture.result = result
+        logger.info(f"Classification decided by the {capture.tiers['classify']} model tier")
+        return self._accept(result)
+
+    def _accept(self, result: HSAResult) -> bool:
+        """Whether a classification is eligible and confident enough to extract."""
+        if not result.is_hsa_eligible:
+            logger.info(f"Not HSA-eligible (confidence={result.confidence:.2f}): {result.reason}")
+            return False
+
+        if result.confidence < self.settings.hsa_confidence_threshold:
+            logger.info(
+                f"HSA-eligible but confidence {result.confidence:.2f} below "
+                f"threshold {self.settings.hsa_confidence_threshold} — skipping"
+            )
+            return False
+
+        return True
+
+    def extract(self, capture: Capture, message: EmailMessage) -> bool:
+        """Step 4: extract date, item and amount. Returns True if an amount was found.
+
+        Reuses the combined-mode extraction when there is one; if that found
+        no amount, the dedicated extractor gets a second look. A capture sent
+        as text or downscaled tiles with no amount found (e.g. the total is
+        in an image, or too small to read) is extracted again from the
+        original PDF or full-resolution screenshot, rendering it if deferred.
+        """
+        extracted = capture.extracted
+        speculated = False
+        if extracted is None and capture.speculative:
             try:
-                screenshot = render_email_to_screenshot(message.body_html, message.body_text)
-                captures.append((screenshot, "image/png"))
+                extracted = capture.speculative.result()
+                speculated = True
             except Exception as e:
-                logger.error(f"Screenshot failed: {e} — skipping email")
-                return
+                logger.warning(f"Speculative extraction failed: {e} — extracting again")
+            capture.speculative = None
+        # A speculative result already came from _extract_parts over the same
+        # payload, so asking again would only repeat it
+        if extracted is None or (extracted.amount is None and not speculated):
+            extracted = self._extract_parts(capture, message)
 
-        # ── Steps 3–6: Classify → Extract → Upload → Log ────────────────
-        any_eligible = False
-        for content, mime_type in captures:
-            result = self.classifier.classify(content, mime_type)
+        if extracted.amount is None and capture.llm_parts:
+            # llm_parts is text or downscaled tiles; the original PNG or PDF is
+            # the only payload that differs from what was just tried
+            logger.info("No amount in the text or prepared image — extracting from the original document instead")
+            if self._ensure_rendered(capture, message):
+                capture.llm_parts = []
+                extracted = self._extract_parts(capture, message)
+        capture.extracted = extracted
+        logger.info(f"Extraction decided by the {capture.tiers.get('extract', STRONG)} model tier")
 
-            if not result.is_hsa_eligible:
-                logger.info(f"Not HSA-eligible (confidence={result.confidence:.2f}): {result.reason}")
-                continue
+        if extracted.amount is None:
+            logger.warning(f"Could not extract amount from '{message.subject}' — skipping upload")
+            return False
+        return True
 
-            if result.confidence < self.settings.hsa_confidence_threshold:
-                logger.info(
-                    f"HSA-eligible but confidence {result.confidence:.2f} below "
-                    f"threshold {self.settings.hsa_confidence_threshold} — skipping"
-                )
-                continue
+    def upload(self, capture: Capture, message: EmailMessage) -> None:
+        """Step 5: upload the capture to Google Drive, rendering it first if deferred."""
+        if not self._ensure_rendered(capture, message):
+            raise RuntimeError(f"Could not render '{message.subject}' for upload")
 
-            any_eligible = True
+        extracted = capture.extracted
+        extension = ".pdf" if capture.mime_type == "application/pdf" else ".png"
+        filename = format_filename(extracted.purchase_date, extracted.amount, extension)
 
-            # ── Step 4: Extract ──────────────────────────────────────────
-            extracted = self.extractor.extract(content, mime_type, fallback_date=message.date)
+        capture.drive_link = self.drive_client.upload_file(
+            filename=filename,
+            content=capture.content,
+            mime_type=capture.mime_type,
+        )
+        logger.info(f"Uploaded to Drive: {filename} → {capture.drive_link}")
 
-            if extracted.amount is None:
-                logger.warning(f"Could not extract amount from '{message.subject}' — skipping upload")
-                continue
+    def log(self, capture: Capture) -> Future | None:
+        """Step 6: append a row for the capture to the Google Sheet.
 
-            # ── Step 5: Upload to Google Drive ───────────────────────────
-            extension = ".pdf" if mime_type == "application/pdf" else ".png"
-            filename = format_filename(extracted.purchase_date, extracted.amount, extension)
+        With a SheetsBatchWriter the row is only buffered, and the returned
+        Future resolves once it is in the sheet; otherwise returns None.
+        """
+        extracted = capture.extracted
+        row = SheetRow(
+            purchase_date=extracted.purchase_date.strftime("%Y-%m-%d"),
+            item_name=extracted.item_name,
+            amount=f"${extracted.amount:.2f}",
+            drive_link=capture.drive_link,
+        )
+        written = self.sheets_client.append_row(row)
+        logger.info(f"Logged to Sheet: {row.purchase_date} | {row.item_name} | {row.amount}")
+        return written
 
-            drive_link = self.drive_client.upload_file(
-                filename=filename,
-                content=content,
-                mime_type=mime_type,
-            )
-            logger.info(f"Uploaded to Drive: {filename} → {drive_link}")
-
-            # ── Step 6: Log to Google Sheet ──────────────────────────────
-            row = SheetRow(
-                purchase_date=extracted.purchase_date.strftime("%Y-%m-%d"),
-                item_name=extracted.item_name,
-                amount=f"${extracted.amount:.2f}",
-                drive_link=drive_link,
-            )
-            self.sheets_client.append_row(row)
-            logger.info(f"Logged to Sheet: {row.purchase_date} | {row.item_name} | {row.amount}")
+    def flush_log(self) -> None:
+        """Write any Sheet rows still buffered by a SheetsBatchWriter."""
+        if isinstance(self.sheets_client, SheetsBatchWriter):
+            self.sheets_client.flush()
 
-        # ── Step 7: Mark as processed ────────────────────────────────────
+    def finish(self, message: EmailMessage, any_eligible: bool) -> None:
+        """Step 7: mark the email as processed, and teach the pre-filter the verdict."""
+        if self.prefilter:
+            try:
+                self.prefilter.record(message, any_eligible)
+            except Exception as e:
+                logger.warning(f"Could not record pre-filter example: {e}")
         if any_eligible:
             self.dedup.mark_processed(message.message_id)
             logger.info(f"Done: {message.subject}")
@@ -120,3 +365,110 @@ class HSAAgent:
             # Still mark as processed so we don't re-check non-HSA emails
             self.dedup.mark_processed(message.message_id)
             logger.info(f"No HSA-eligible items found in: '{message.subject}'")
+
+    def close(self) -> None:
+        """Release long-lived resources (warm browsers, pooled connections)."""
+        if self._speculator:
+            self._speculator.shutdown(cancel_futures=True)
+        if self.renderer:
+            self.renderer.close()
+        close_clients()
+
+    def _capture_pdf(self, pdf: bytes) -> Capture:
+        capture = Capture(content=pdf, mime_type="application/pdf")
+
+        if self.settings.pdf_text_mode:
+            layer = extract_text_layer(pdf)
+            if is_text_layer_usable(layer, self.settings.pdf_min_chars_per_page):
+                text = layer.text[:self.settings.pdf_max_text_chars]
+                capture.llm_parts = [(text.encode("utf-8"), "text/plain")]
+                logger.info(
+                    f"Using PDF text layer ({layer.page_count} page(s), {len(text)} chars) "
+                    f"instead of {len(pdf)} PDF bytes"
+                )
+                return capture
+            logger.info("PDF has no usable text layer — sending the document")
+
+        if self.settings.pdf_max_pages > 0:
+            trimmed = trim_pdf(pdf, max_pages=self.settings.pdf_max_pages)
+            if trimmed:
+                capture.llm_parts = [(trimmed, "application/pdf")]
+        return capture
+
+    def _is_likely_receipt(self, capture: Capture, message: EmailMessage) -> bool:
+        """Whether to extract speculatively, per settings.speculative_extraction:
+
+        "all"     — every capture
+        "pdfs"    — every PDF
+        "senders" — PDFs from a domain in speculative_senders, or one whose past
+                    mail was mostly HSA-eligible (learned by the pre-filter)
+        """
+        mode = self.settings.speculative_extraction
+        if mode == "all":
+            return True
+        if capture.mime_type != "application/pdf":
+            return False
+        if mode == "pdfs":
+            return True
+
+        sender_domain = parseaddr(message.from_address)[1].lower().rpartition("@")[2]
+        if any(
+            sender_domain == domain or sender_domain.endswith("." + domain)
+            for domain in self.settings.speculative_senders
+        ):
+            return True
+        prior = self.prefilter.sender_prior(message) if self.prefilter else None
+        return prior is not None and prior >= 0.5
+
+    def _extract_parts(self, capture: Capture, message: EmailMessage):
+        if self.cascade:
+            extracted, capture.tiers["extract"] = self.cascade.extract_parts(capture.payload, message.date)
+            return extracted
+        capture.tiers["extract"] = STRONG
+        return self.extractor.extract_parts(capture.payload, fallback_date=message.date)
+
+    def _prepare_image(self, png: bytes) -> list[tuple[bytes, str]]:
+        """Downscaled, re-encoded tiles of a screenshot for Claude, or [] to send it as is."""
+        if not self.settings.image_prep_enabled:
+            return []
+        try:
+            return prepare_image(
+                png,
+                max_width=self.settings.image_max_width,
+                tile_height=self.settings.image_tile_height,
+                max_tiles=self.settings.image_max_tiles,
+                image_format=self.settings.image_format,
+            )
+        except Exception as e:
+            logger.warning(f"Image preparation failed: {e} — sending the original PNG")
+            return []
+
+    def _ensure_rendered(self, capture: Capture, message: EmailMessage) -> bool:
+        """Render the screenshot for a text-first capture if it hasn't been yet."""
+        if capture.content:
+            return True
+        logger.info(f"Rendering deferred screenshot for '{message.subject}'")
+        try:
+            capture.content = self._render(message.body_html, message.body_text)
+        except Exception as e:
+            logger.error(f"Screenshot failed: {e}")
+            return False
+        return True
+
+    def _render(self, html: str, text_fallback: str) -> bytes:
+        if self.renderer:
+            return self.renderer.render(html, text_fallback)
+        if self.settings.screenshot_offline:
+            # No warm pool, but the same request interception and render
+            # budget, on a browser launched for this email
+            renderer = ScreenshotRenderer(
+                pool_size=1,
+                offline=True,
+                asset_cache=self._asset_cache,
+                budget_seconds=self.settings.screenshot_budget_seconds,
+            )
+            try:
+                return renderer.render(html, text_fallback)
+            finally:
+                renderer.close()
+        return render_email_to_screenshot(html, text_fallback)
@@ -0,0 +1,395 @@
+import functools
+import hashlib
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import Callable
+
+from agent.hsa_agent import HSAAgent
+from config import PIPELINE_STAGES
+from models.data_models import Capture, EmailMessage, ExtractedData, HSAResult
+from utils.logger import get_logger
+from utils.work_queue import WorkItem, WorkQueue
+
+logger = get_logger(__name__)
+
+STAGES = PIPELINE_STAGES
+
+DEFAULT_WORKERS = {
+    "capture": 2,    # Chromium renders
+    "classify": 4,   # Claude calls
+    "extract": 4,    # Claude calls
+    "upload": 2,     # Drive uploads
+    "log": 1,        # Sheets appends
+}
+
+_STOP = object()     # sentinel that tells a worker thread to exit
+
+QUEUE_POLL_SECONDS = 2   # how often the feeder looks for work when the queue is empty
+
+
+@dataclass
+class _Job:
+    """One email travelling through the pipeline."""
+    message: EmailMessage
+    captures: list[Capture] = field(default_factory=list)   # everything captured
+    accepted: list[Capture] = field(default_factory=list)   # passed classification
+    ready: list[Capture] = field(default_factory=list)      # extracted with an amount
+    item: WorkItem | None = None    # set when the email came from a WorkQueue
+    error: str = ""                 # why the job stopped early and should be retried
+    deferred: bool = False          # released by a callback once its Sheet rows are written
+
+
+class Pipeline:
+    """Runs HSAAgent's steps as a staged, concurrent pipeline:
+
+        capture → classify → extract → upload → log
+
+    Each stage has its own pool of worker threads, and stages are joined by
+    bounded queues. When a downstream stage falls behind its queue fills up
+    and upstream workers block, so backpressure reaches all the way back to
+    the monitors calling submit().
+
+    An email is always handled as a single job, so its captures are classified,
+    uploaded and logged in order and it is marked processed exactly once, after
+    its last step. Emails already in the dedup store, or already in flight
+    (e.g. the same Message-ID delivered to two accounts), are dropped at submit().
+
+    With a WorkQueue, monitors call enqueue() instead of submit() and a feeder
+    thread claims emails from the queue into the pipeline. Each job reports
+    back when it is done (complete) or fails (retry with backoff). Uploads
+    and Sheet rows are checkpointed per capture, so a retry resumes without
+    repeating them, and emails interrupted by a crash resume at the next start.
+    Classification and extraction results are checkpointed too: a retry
+    captures the email again (PDFs and screenshots aren't stored), but
+    reuses earlier answers instead of calling Claude again.
+
+    With a SheetsBatchWriter, an email is only marked processed (and its
+    work item completed) once its buffered rows have actually been written.
+    """
+
+    def __init__(
+        self,
+        agent: HSAAgent,
+        workers: dict[str, int] | None = None,
+        queue_size: int = 10,
+        work_queue: WorkQueue | None = None,
+        on_done: Callable[[EmailMessage, bool], None] | None = None,
+    ):
+        self.agent = agent
+        self.work_queue = work_queue
+        # Called with (message, succeeded) when an email leaves the pipeline
+        self.on_done = on_done
+        self.workers = {**DEFAULT_WORKERS, **(workers or {})}
+        self._queues: dict[str, queue.Queue] = {stage: queue.Queue(maxsize=queue_size) for stage in STAGES}
+        self._threads: dict[str, list[threading.Thread]] = {stage: [] for stage in STAGES}
+        self._in_flight: set[str] = set()
+        self._lock = threading.Lock()
+        self._feeder: threading.Thread | None = None
+        self._stop_feeding = threading.Event()
+
+    def start(self) -> None:
+        """Start every stage's worker threads (and the feeder, with a WorkQueue)."""
+        for stage in STAGES:
+            for i in range(max(1, self.workers[stage])):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stage,),
+                    daemon=True,
+                    name=f"pipeline-{stage}-{i}",
+                )
+                thread.start()
+                self._threads[stage].append(thread)
+        logger.info(
+            "Pipeline started: " + ", ".join(f"{stage}×{len(self._threads[stage])}" for stage in STAGES)
+        )
+
+        if self.work_queue:
+            self.work_queue.recover()
+            self._stop_feeding.clear()
+            self._feeder = threading.Thread(target=self._feed, daemon=True, name="pipeline-feeder")
+            self._feeder.start()
+
+    def enqueue(self, message: EmailMessage) -> None:
+        """Persist an email to the WorkQueue, or submit it directly without one."""
+        if not self.work_queue:
+            self.submit(message)
+            return
+        if self.work_queue.enqueue(message):
+            logger.info(f"Enqueued: '{message.subject}' from {message.from_address}")
+
+    def submit(self, message: EmailMessage, item: WorkItem | None = None) -> bool:
+        """Queue an email for processing. Blocks while the pipeline is full.
+
+        Returns False if the email was dropped as a duplicate.
+        """
+        with self._lock:
+            duplicate = ""
+            if message.message_id in self._in_flight:
+                duplicate = "Already in flight"
+            elif self.agent.dedup.already_processed(message.message_id):
+                duplicate = "Already processed"
+            else:
+                self._in_flight.add(message.message_id)
+        if duplicate:
+            logger.info(f"{duplicate} — skipping: {message.message_id}")
+            if item and duplicate == "Already processed":
+                self.work_queue.complete(item)
+            elif item:
+                # Its claim expired while a slow job still holds it
+                self.work_queue.release(item)
+            return False
+
+        logger.info(f"Queued: '{message.subject}' from {message.from_address}")
+        self._queues["capture"].put(_Job(message=message, item=item))
+        return True
+
+    def stop(self) -> None:
+        """Let every queued email finish, then stop the worker threads.
+
+        Stages are drained in order, so by the time a stage receives its stop
+        sentinels every upstream job has already been handed to it.
+        Emails still waiting in the WorkQueue stay there for the next start.
+        """
+        if self._feeder:
+            self._stop_feeding.set()
+            self._feeder.join()
+            self._feeder = None
+        for stage in STAGES:
+            for _ in self._threads[stage]:
+                self._queues[stage].put(_STOP)
+            for thread in self._threads[stage]:
+                thread.join()
+            self._threads[stage] = []
+        # Jobs waiting on buffered Sheet rows are released as they are written;
+        # rows that still fail are failed when the writer is closed
+        try:
+            self.agent.flush_log()
+        except Exception as e:
+            logger.error(f"Could not flush buffered Sheet rows: {e}")
+        logger.info("Pipeline stopped")
+
+    # ── Worker loop ──────────────────────────────────────────────────────
+
+    def _feed(self) -> None:
+        """Claim emails from the WorkQueue into the pipeline until stop()."""
+        while not self._stop_feeding.is_set():
+            try:
+                item = self.work_queue.claim()
+            except Exception as e:
+                logger.error(f"Could not claim from the work queue: {e}")
+                item = None
+            if item is None:
+                self._stop_feeding.wait(QUEUE_POLL_SECONDS)
+                continue
+            if item.attempts > 1:
+                logger.info(
+                    f"Retrying '{item.message.subject}' (attempt {item.attempts}, "
+                    f"resuming at {item.stage or 'capture'})"
+                )
+            self.submit(item.message, item=item)
+
+    def _worker(self, stage: str) -> None:
+        handler = getattr(self, f"_{stage}")
+        inbox = self._queues[stage]
+        index = STAGES.index(stage)
+
+        while True:
+            job = inbox.get()
+            if job is _STOP:
+                return
+
+            try:
+                keep_going = handler(job)
+            except Exception as e:
+                logger.error(
+                    f"Unhandled error in {stage} stage for '{job.message.subject}': {e}",
+                    exc_info=True,
+                )
+                job.error = f"{type(e).__name__}: {e}"
+                keep_going = False
+
+            if keep_going and index + 1 < len(STAGES):
+                self._checkpoint(job, STAGES[index + 1])
+                self._queues[STAGES[index + 1]].put(job)
+            elif not job.deferred:
+                self._release(job)
+
+    def _checkpoint(self, job: _Job, stage: str) -> None:
+        if job.item:
+            try:
+                self.work_queue.checkpoint(job.item, stage)
+            except Exception as e:
+                logger.warning(f"Could not checkpoint '{job.message.subject}' at {stage}: {e}")
+
+    def _release(self, job: _Job) -> None:
+        with self._lock:
+            self._in_flight.discard(job.message.message_id)
+        if self.on_done:
+            try:
+                self.on_done(job.message, not job.error)
+            except Exception as e:
+                logger.error(f"on_done callback failed for '{job.message.subject}': {e}")
+        if not job.item:
+            return
+        try:
+            if job.error:
+                self.work_queue.fail(job.item, job.error)
+            else:
+                self.work_queue.complete(job.item)
+        except Exception as e:
+            # The claim expires and the email is retried after the visibility timeout
+            logger.error(f"Could not update the work queue for '{job.message.subject}': {e}")
+
+    # ── Stage handlers — return True to pass the job downstream ─────────
+
+    def _capture(self, job: _Job) -> bool:
+        logger.info(f"Processing: '{job.message.subject}' from {job.message.from_address}")
+        if self.agent.prefiltered(job.message):
+            return False
+        job.captures = self.agent.capture(job.message)
+        if not job.captures:
+            job.error = "Nothing could be captured"
+            return False
+        return True
+
+    def _classify(self, job: _Job) -> bool:
+        classified = job.item.state.get("classified", {}) if job.item else {}
+        keys = [capture_key(capture) for capture in job.captures]
+        if classified and all(key in classified for key in keys):
+            # Classified by an earlier attempt
+            verdicts = []
+            for capture, key in zip(job.captures, keys):
+                capture.result = HSAResult(**classified[key]["result"])
+                if classified[key].get("extracted"):
+                    capture.extracted = _decode_extracted(classified[key]["extracted"])
+                verdicts.append(classified[key]["accepted"])
+        else:
+            verdicts = self.agent.classify_all(job.captures, job.message)
+            if job.item:
+                job.item.state["classified"] = {
+                    key: {
+                        "result": asdict(capture.result),
+                        "extracted": _encode_extracted(capture.extracted) if capture.extracted else None,
+                        "accepted": accepted,
+                    }
+                    for capture, key, accepted in zip(job.captures, keys, verdicts)
+                }
+        job.accepted = [capture for capture, accepted in zip(job.captures, verdicts) if accepted]
+        if not job.accepted:
+            self.agent.finish(job.message, any_eligible=False)
+            return False
+        return True
+
+    def _extract(self, job: _Job) -> bool:
+        extracted = job.item.state.setdefault("extracted", {}) if job.item else {}
+        job.ready = []
+        for capture in job.accepted:
+            key = capture_key(capture)
+            if key in extracted:
+                # Extracted by an earlier attempt
+                capture.extracted = _decode_extracted(extracted[key])
+            else:
+                self.agent.extract(capture, job.message)
+                if job.item:
+                    extracted[key] = _encode_extracted(capture.extracted)
+            if capture.extracted.amount is not None:
+                job.ready.append(capture)
+        if not job.ready:
+            self.agent.finish(job.message, any_eligible=True)
+            return False
+        return True
+
+    def _upload(self, job: _Job) -> bool:
+        uploaded = job.item.state.setdefault("uploaded", {}) if job.item else {}
+        for capture in job.ready:
+            key = capture_key(capture)
+            if key in uploaded:
+                # Uploaded by an earlier attempt
+                capture.drive_link = uploaded[key]
+                continue
+            self.agent.upload(capture, job.message)
+            if job.item:
+                uploaded[key] = capture.drive_link
+                self._checkpoint(job, "upload")
+        return True
+
+    def _log(self, job: _Job) -> bool:
+        logged = job.item.state.setdefault("logged", []) if job.item else []
+        buffered = []
+        for capture in job.ready:
+            key = capture_key(capture)
+            if key in logged:
+                continue
+            written = self.agent.log(capture)
+            if written is None:
+                self._logged(job, logged, key)
+            else:
+                buffered.append((key, written))
+        if not buffered:
+            self.agent.finish(job.message, any_eligible=True)
+            return True
+
+        # The rows are only buffered: mark the email processed, and release
+        # it, once every one of them is in the sheet
+        job.deferred = True
+        remaining = [len(buffered)]
+        lock = threading.Lock()
+
+        def on_written(key: str, written: Future) -> None:
+            error = written.exception()
+            with lock:
+                if error is None:
+                    self._logged(job, logged, key)
+                if error is not None and not job.error:
+                    job.error = f"{type(error).__name__}: {error}"
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if not job.error:
+                try:
+                    self.agent.finish(job.message, any_eligible=True)
+                except Exception as e:
+                    logger.error(f"Could not finish '{job.message.subject}': {e}", exc_info=True)
+                    job.error = f"{type(e).__name__}: {e}"
+            self._release(job)
+
+        for key, written in buffered:
+            written.add_done_callback(functools.partial(on_written, key))
+        return True
+
+    def _logged(self, job: _Job, logged: list, key: str) -> None:
+        if job.item:
+            logged.append(key)
+            self._checkpoint(job, "log")
+
+
+def capture_key(capture: Capture) -> str:
+    """Identifies a capture across attempts, whatever its position in the job.
+
+    A PDF is keyed by a hash of its bytes, as in ResultCache. An email has at
+    most one screenshot, and a re-render may differ byte for byte, so it is
+    simply "screenshot".
+    """
+    if capture.mime_type == "application/pdf":
+        return f"pdf:{hashlib.sha256(capture.content).hexdigest()}"
+    return "screenshot"
+
+
+def _encode_extracted(extracted: ExtractedData) -> dict:
+    return {
+        "purchase_date": extracted.purchase_date.isoformat() if extracted.purchase_date else None,
+        "item_name": extracted.item_name,
+        "amount": str(extracted.amount) if extracted.amount is not None else None,
+    }
+
+
+def _decode_extracted(data: dict) -> ExtractedData:
+    return ExtractedData(
+        purchase_date=date.fromisoformat(data["purchase_date"]) if data["purchase_date"] else None,
+        item_name=data["item_name"],
+        amount=Decimal(data["amount"]) if data["amount"] is not None else None,
+    )
@@ -0,0 +1,213 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+from email.utils import parseaddr
+
+from capture.html_text import html_to_text
+from models.data_models import EmailMessage
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+MAX_BODY_CHARS = 5000
+MAX_EXAMPLES = 5000          # most recent decisions used for training
+RETRAIN_EVERY = 50           # new decisions between retrains
+CV_FOLDS = 5
+MIN_POSITIVES = 20           # HSA emails needed before the recall floor can be estimated
+
+_WORD = re.compile(r"[a-z][a-z0-9']{2,19}")
+
+
+class PreFilter:
+    """Local naive Bayes model that skips obvious non-HSA mail before any
+    capture or Claude call.
+
+    Trained on the agent's own past decisions (stored in the shared SQLite
+    file), over the sender's domain, subject words, body words and whether
+    a PDF is attached. The skip threshold is set from cross-validated
+    scores of past HSA emails, so that at least `recall_floor` of them
+    would still have gone to Claude. Nothing is skipped until there are
+    `min_samples` decisions, at least MIN_POSITIVES of them HSA emails.
+
+    In shadow mode nothing is skipped: emails the filter would have skipped
+    are logged and counted, and any that Claude then finds eligible are
+    reported as misses. Skipped emails are never used for training.
+    """
+
+    def __init__(self, db_path: str, recall_floor: float = 0.99, min_samples: int = 200, shadow: bool = True):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.recall_floor = recall_floor
+        self.min_samples = min_samples
+        self.shadow = shadow
+        self._lock = threading.Lock()
+        self._model: _NaiveBayes | None = None
+        self._threshold: float | None = None
+        self._since_training = 0
+        self._would_skip: set[str] = set()
+        self._skipped = 0
+        self._shadow_skips = 0
+        self._shadow_misses = 0
+        self._create_table()
+        with self._lock:
+            self._train()
+
+    def _create_table(self) -> None:
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS prefilter_examples (
+                message_id   TEXT PRIMARY KEY,
+                features     TEXT NOT NULL,
+                eligible     INTEGER NOT NULL,
+                created_at   TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def should_skip(self, message: EmailMessage) -> bool:
+        """True if the email is confidently not HSA-related (never in shadow mode)."""
+        with self._lock:
+            if self._model is None or self._threshold is None:
+                return False
+            score = self._model.score(features(message))
+            if score >= self._threshold:
+                return False
+            if self.shadow:
+                self._would_skip.add(message.message_id)
+                self._shadow_skips += 1
+                logger.info(f"Pre-filter (shadow) would skip score={score:.2f}: '{message.subject}'")
+                return False
+            self._skipped += 1
+        logger.info(f"Pre-filter skipped score={score:.2f} < {self._threshold:.2f}: '{message.subject}'")
+        return True
+
+    def record(self, message: EmailMessage, eligible: bool) -> None:
+        """Store Claude's verdict on an email as a training example."""
+        with self._lock:
+            if message.message_id in self._would_skip:
+                self._would_skip.discard(message.message_id)
+                if eligible:
+                    self._shadow_misses += 1
+                    logger.warning(f"Pre-filter (shadow) would have missed an HSA email: '{message.subject}'")
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO prefilter_examples (message_id, features, eligible, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (message.message_id, json.dumps(sorted(features(message))), int(eligible), datetime.utcnow().isoformat()),
+            )
+            self.conn.commit()
+            self._since_training += 1
+            if self._since_training >= RETRAIN_EVERY:
+                self._train()
+
+    def sender_prior(self, message: EmailMessage, min_emails: int = 3) -> float | None:
+        """Share of past emails from this sender's domain that were HSA-eligible,
+        or None with fewer than `min_emails` verdicts to go on."""
+        domain = _registered_domain(message.from_address)
+        if not domain:
+            return None
+        with self._lock:
+            if self._model is None:
+                return None
+            token = f"domain:{domain}"
+            positives = self._model.token_docs[True][token]
+            total = positives + self._model.token_docs[False][token]
+        return positives / total if total >= min_emails else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "shadow": self.shadow,
+                "threshold": round(self._threshold, 3) if self._threshold is not None else None,
+                "skipped": self._skipped,
+                "shadow_would_skip": self._shadow_skips,
+                "shadow_misses": self._shadow_misses,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def _train(self) -> None:
+        """Refit on the latest examples and pick the threshold. Caller holds the lock."""
+        self._since_training = 0
+        rows = self.conn.execute(
+            "SELECT features, eligible FROM prefilter_examples ORDER BY created_at DESC LIMIT ?",
+            (MAX_EXAMPLES,),
+        ).fetchall()
+        examples = [(json.loads(tokens), bool(eligible)) for tokens, eligible in rows]
+        positives = sum(1 for _, eligible in examples if eligible)
+        if len(examples) < self.min_samples or positives < MIN_POSITIVES:
+            logger.debug(f"Pre-filter not trained yet: {len(examples)} example(s), {positives} HSA")
+            return
+
+        # Score every past HSA email with a model that never saw it
+        positive_scores = []
+        for fold in range(CV_FOLDS):
+            model = _NaiveBayes([ex for i, ex in enumerate(examples) if i % CV_FOLDS != fold])
+            positive_scores += [
+                model.score(tokens) for i, (tokens, eligible) in enumerate(examples)
+                if eligible and i % CV_FOLDS == fold
+            ]
+        positive_scores.sort()
+        allowed_misses = int(len(positive_scores) * (1 - self.recall_floor))
+        self._threshold = positive_scores[allowed_misses]
+        self._model = _NaiveBayes(examples)
+
+        negative_scores = [self._model.score(tokens) for tokens, eligible in examples if not eligible]
+        skippable = sum(1 for score in negative_scores if score < self._threshold)
+        logger.info(
+            f"Pre-filter trained on {len(examples)} email(s): threshold {self._threshold:.2f} keeps "
+            f"{self.recall_floor:.1%} of HSA mail, would skip {skippable}/{len(negative_scores)} others"
+        )
+
+
+class _NaiveBayes:
+    """Naive Bayes over which tokens an email contains, Laplace-smoothed."""
+
+    def __init__(self, examples: list[tuple[list[str], bool]]):
+        self.docs = Counter()
+        self.token_docs = {True: Counter(), False: Counter()}
+        for tokens, eligible in examples:
+            self.docs[eligible] += 1
+            self.token_docs[eligible].update(set(tokens))
+
+    def score(self, tokens) -> float:
+        """Log-odds that an email with these tokens is HSA-eligible."""
+        total = self.docs[True] + self.docs[False]
+        log_odds = math.log((self.docs[True] + 1) / (total + 2)) - math.log((self.docs[False] + 1) / (total + 2))
+        for token in set(tokens):
+            p_pos = (self.token_docs[True][token] + 1) / (self.docs[True] + 2)
+            p_neg = (self.token_docs[False][token] + 1) / (self.docs[False] + 2)
+            log_odds += math.log(p_pos) - math.log(p_neg)
+        return log_odds
+
+
+def features(message: EmailMessage) -> set[str]:
+    """Sender domain, subject words, body words and a has-PDF flag."""
+    tokens = set()
+    address = parseaddr(message.from_address)[1].lower()
+    if "@" in address:
+        tokens.add(f"domain:{address.rsplit('@', 1)[1]}")
+        # Also the registered domain, so mail.cvs.com and cvs.com match
+        tokens.add(f"domain:{_registered_domain(message.from_address)}")
+    tokens.update(f"subject:{word}" for word in _WORD.findall(message.subject.lower()))
+
+    body = html_to_text(message.body_html, max_chars=MAX_BODY_CHARS) if message.body_html else message.body_text
+    tokens.update(f"body:{word}" for word in _WORD.findall(body[:MAX_BODY_CHARS].lower()))
+
+    if any(a.mime_type == "application/pdf" or a.filename.lower().endswith(".pdf") for a in message.attachments):
+        tokens.add("has:pdf")
+    return tokens
+
+
+def _registered_domain(from_address: str) -> str:
+    """"CVS <rx@mail.cvs.com>" → "cvs.com"."""
+    address = parseaddr(from_address)[1].lower()
+    if "@" not in address:
+        return ""
+    return ".".join(address.rsplit("@", 1)[1].split(".")[-2:])
@@ -58,3 +58,72 @@ Respond with ONLY valid JSON — no markdown, no explanation, no extra text:
 
 If you cannot confidently determine a field from the image, use null for that field.
 """.strip()
+
+
+COMBINED_PROMPT = """
+You are an expert in IRS HSA (Health Savings Account) regulations under IRS Publication 502,
+and a precise data extraction assistant.
+
+Examine the provided receipt, bill, or email and do two things in one answer.
+
+First, decide whether the purchase qualifies as an HSA-eligible medical expense.
+
+HSA-ELIGIBLE examples:
+- Prescription medications
+- Doctor, dentist, or vision visits and copays
+- Medical equipment (blood pressure monitors, CPAP machines, etc.)
+- Lab tests, X-rays, MRIs
+- Mental health therapy sessions
+- Surgery or hospital bills
+- Chiropractic or physical therapy
+- Hearing aids
+- Ambulance services
+
+NOT HSA-ELIGIBLE examples:
+- Cosmetic procedures (teeth whitening, Botox, etc.)
+- Gym memberships or fitness equipment (unless prescribed)
+- General vitamins or supplements (unless prescribed for a diagnosed condition)
+- Over-the-counter items that are not for a diagnosed condition
+- Insurance premiums (with very limited exceptions)
+- Toiletries or personal care items
+
+Second, if it is HSA-eligible, extract:
+
+1. purchase_date — The date the service was provided or item was purchased.
+   Use the date of service, NOT the date the email was sent or the invoice was generated.
+   Format: YYYY-MM-DD (e.g. 2026-02-20)
+
+2. item_name — The name of the item, service, prescription, or medical procedure.
+   Be concise — under 60 characters. If multiple items, describe the primary one.
+
+3. amount — The total amount charged or billed.
+   Return as a plain number with two decimal places (e.g. 45.60).
+   If there are multiple line items, return the grand total.
+   Do NOT include currency symbols.
+
+Respond with ONLY valid JSON — no markdown, no explanation, no extra text:
+{
+  "is_hsa_eligible": true or false,
+  "confidence": a number between 0.0 and 1.0,
+  "reason": "one sentence explanation under 100 characters",
+  "purchase_date": "YYYY-MM-DD",
+  "item_name": "string",
+  "amount": number
+}
+
+If the document is not HSA-eligible, or you cannot confidently determine an extraction
+field, use null for that field.
+""".strip()
+
+
+BATCH_PREFIX = """
+You will receive several documents from the same email, each introduced by a label such as
+"Document 1". Apply the instructions below to each document separately.
+
+Respond with ONLY a JSON array — no markdown, no explanation, no extra text — holding one
+object per document, in the same order as the documents, each in the format described below.
+""".strip()
+
+BATCH_CLASSIFICATION_PROMPT = f"{BATCH_PREFIX}\n\n{CLASSIFICATION_PROMPT}"
+
+BATCH_COMBINED_PROMPT = f"{BATCH_PREFIX}\n\n{COMBINED_PROMPT}"
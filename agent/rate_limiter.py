@@ -0,0 +1,292 @@
+import base64
+import io
+import random
+import re
+import threading
+import time
+
+import anthropic
+from PIL import Image
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+THROTTLE_STATUS_CODES = (429, 529)   # rate limited, overloaded
+TRANSIENT_STATUS_CODES = (408, 409, 500, 502, 503, 504)
+DEFAULT_PAUSE_SECONDS = 5            # when a 429/529 has no retry-after header
+MAX_PAUSE_SECONDS = 60
+TRANSIENT_BACKOFF_SECONDS = 1        # doubled per retry of a timeout, dropped connection or 5xx
+STATS_LOG_SECONDS = 60
+MAX_IMAGE_TOKENS = 1600              # the API downsizes larger images to about this
+TOKENS_PER_PDF_PAGE = 2000           # page image plus its text
+
+_PDF_PAGE = re.compile(rb"/Type\s*/Page(?!s)")
+
+
+class _TokenBucket:
+    """Continuously refilled budget of `per_minute` units. 0 disables it."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.per_minute, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until `cost` units are available (cost is capped at one minute's worth)."""
+        if not self.per_minute:
+            return 0.0
+        self._refill(now)
+        missing = min(cost, self.per_minute) - self.level
+        return max(0.0, missing * 60 / self.per_minute)
+
+    def take(self, cost: float, now: float) -> None:
+        if self.per_minute:
+            self._refill(now)
+            self.level -= cost
+
+
+class RateLimiter:
+    """Shared throttle for every Claude call the agent makes.
+
+    Combines three token buckets (requests, input tokens and output tokens
+    per minute, matching the API's own limits) with an AIMD limit on how
+    many calls may be in flight at once:
+
+    - every `concurrency` successful calls in a row raise the limit by one,
+      up to `max_concurrency` (additive increase)
+    - a 429 or 529 halves it (multiplicative decrease) and pauses every
+      caller for the response's retry-after, then the call is retried;
+      the rejected attempt's request and tokens are refunded
+
+    Timeouts, dropped connections, 408/409 and 5xx responses are retried with
+    jittered exponential backoff, without touching the limit. The SDK's own
+    retries are turned off, since they would hide throttling from the limiter.
+
+    Input tokens are estimated before the call and corrected from the
+    response's usage afterwards; output tokens are reserved as max_tokens.
+    Safe to share between threads; callers block in create_message while
+    over a limit.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        input_tokens_per_minute: int = 0,
+        output_tokens_per_minute: int = 0,
+        max_concurrency: int = 8,
+        max_retries: int = 6,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.concurrency = self.max_concurrency
+        self._requests = _TokenBucket(requests_per_minute)
+        self._input_tokens = _TokenBucket(input_tokens_per_minute)
+        self._output_tokens = _TokenBucket(output_tokens_per_minute)
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._calls = 0
+        self._throttled = 0
+        self._last_stats_log = time.monotonic()
+
+    def create_message(self, client: anthropic.Anthropic, **kwargs):
+        """client.messages.create(**kwargs), within the limits, retrying 429/529."""
+        input_estimate = estimate_input_tokens(kwargs.get("messages", []), kwargs.get("system"))
+        output_estimate = kwargs.get("max_tokens", 1024)
+        # Retried here instead, so throttling is visible to the limiter
+        client = client.with_options(max_retries=0)
+
+        for attempt in range(self.max_retries + 1):
+            self._acquire(input_estimate, output_estimate)
+            try:
+                response = client.messages.create(**kwargs)
+            except anthropic.APIStatusError as e:
+                throttled = e.status_code in THROTTLE_STATUS_CODES
+                # A throttled request was rejected, so it used none of the budget
+                self._release(refund=(input_estimate, output_estimate) if throttled else None)
+                if attempt == self.max_retries:
+                    raise
+                if throttled:
+                    self._on_throttled(e)
+                elif e.status_code in TRANSIENT_STATUS_CODES:
+                    self._backoff(attempt, f"Claude API returned {e.status_code}")
+                else:
+                    raise
+                continue
+            except anthropic.APIConnectionError as e:
+                # Also covers APITimeoutError
+                self._release()
+                if attempt == self.max_retries:
+                    raise
+                self._backoff(attempt, f"Claude request failed ({type(e).__name__})")
+                continue
+            except Exception:
+                self._release()
+                raise
+            self._release(response.usage, input_estimate, output_estimate)
+            return response
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "concurrency_limit": self.concurrency,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "calls": self._calls,
+                "throttled": self._throttled,
+                "rpm": self._requests.per_minute,
+                "input_tpm": self._input_tokens.per_minute,
+                "output_tpm": self._output_tokens.per_minute,
+            }
+
+    def _acquire(self, input_tokens: int, output_tokens: int) -> None:
+        with self._condition:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = max(
+                        self._paused_until - now,
+                        self._requests.wait_time(1, now),
+                        self._input_tokens.wait_time(input_tokens, now),
+                        self._output_tokens.wait_time(output_tokens, now),
+                    )
+                    if wait <= 0 and self._in_flight < self.concurrency:
+                        break
+                    if wait > 1:
+                        logger.debug(f"Waiting {wait:.1f}s for Claude rate limit ({self._waiting} waiting)")
+                    self._condition.wait(timeout=wait if wait > 0 else None)
+
+                self._requests.take(1, now)
+                self._input_tokens.take(input_tokens, now)
+                self._output_tokens.take(output_tokens, now)
+                self._in_flight += 1
+                self._calls += 1
+            finally:
+                self._waiting -= 1
+        self._maybe_log_stats()
+
+    def _release(
+        self,
+        usage=None,
+        input_estimate: int = 0,
+        output_estimate: int = 0,
+        refund: tuple[int, int] | None = None,
+    ) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            if refund is not None:
+                now = time.monotonic()
+                self._requests.take(-1, now)
+                self._input_tokens.take(-refund[0], now)
+                self._output_tokens.take(-refund[1], now)
+            if usage is not None:
+                # Charge what the call really used, not the estimate
+                now = time.monotonic()
+                self._input_tokens.take(_input_usage(usage) - input_estimate, now)
+                self._output_tokens.take(usage.output_tokens - output_estimate, now)
+                self._successes += 1
+                if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._successes = 0
+                    logger.info(f"Claude concurrency limit raised to {self.concurrency}")
+            self._condition.notify_all()
+
+    def _on_throttled(self, error: anthropic.APIStatusError) -> None:
+        pause = _retry_after(error)
+        with self._condition:
+            self._throttled += 1
+            self._successes = 0
+            self.concurrency = max(1, self.concurrency // 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._condition.notify_all()
+        logger.warning(
+            f"Claude API returned {error.status_code} — concurrency limit now {self.concurrency}, "
+            f"pausing {pause:.1f}s"
+        )
+
+    def _backoff(self, attempt: int, reason: str) -> None:
+        pause = min(MAX_PAUSE_SECONDS, TRANSIENT_BACKOFF_SECONDS * 2 ** attempt) * random.uniform(1.0, 1.2)
+        logger.warning(f"{reason} — retrying in {pause:.1f}s")
+        time.sleep(pause)
+
+    def _maybe_log_stats(self) -> None:
+        now = time.monotonic()
+        if now - self._last_stats_log < STATS_LOG_SECONDS:
+            return
+        self._last_stats_log = now
+        logger.info(f"Claude rate limiter: {self.stats()}")
+
+
+def create_message(client: anthropic.Anthropic, limiter: RateLimiter | None, **kwargs):
+    """Send a Messages API request through the limiter, if there is one."""
+    if limiter:
+        return limiter.create_message(client, **kwargs)
+    return client.messages.create(**kwargs)
+
+
+def estimate_input_tokens(messages: list, system=None) -> int:
+    """Rough input token count of a request: ~4 characters per text token,
+    images by their pixel count, PDFs by their page count."""
+    blocks = []
+    if isinstance(system, str):
+        blocks.append({"type": "text", "text": system})
+    elif system:
+        blocks.extend(system)
+    for message in messages:
+        content = message.get("content", "")
+        blocks.extend([{"type": "text", "text": content}] if isinstance(content, str) else content)
+
+    tokens = 0
+    for block in blocks:
+        kind = block.get("type")
+        if kind == "text":
+            tokens += len(block.get("text", "")) // 4 + 1
+        elif kind == "image":
+            tokens += _image_tokens(block["source"].get("data", ""))
+        elif kind == "document":
+            source = block["source"]
+            if source.get("type") == "text":
+                tokens += len(source.get("data", "")) // 4 + 1
+            else:
+                pages = pdf_page_count(base64.b64decode(source.get("data", "")))
+                tokens += max(1, pages) * TOKENS_PER_PDF_PAGE
+    return tokens
+
+
+def pdf_page_count(pdf: bytes) -> int:
+    """Pages in a PDF, counted from its page objects without parsing it."""
+    return len(_PDF_PAGE.findall(pdf))
+
+
+def _image_tokens(data: str) -> int:
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(data))) as image:
+            width, height = image.size
+    except Exception:
+        return MAX_IMAGE_TOKENS
+    return min(MAX_IMAGE_TOKENS, width * height // 750 + 1)
+
+
+def _input_usage(usage) -> int:
+    """Input tokens that count against the input-tokens-per-minute limit."""
+    return (
+        usage.input_tokens
+        + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+    )
+
+
+def _retry_after(error: anthropic.APIStatusError) -> float:
+    try:
+        seconds = float(error.response.headers.get("retry-after", ""))
+    except (TypeError, ValueError):
+        seconds = DEFAULT_PAUSE_SECONDS
+    # Jitter, so paused callers don't all retry in the same instant
+    return min(MAX_PAUSE_SECONDS, seconds) * random.uniform(1.0, 1.2)
@@ -0,0 +1,85 @@
+import base64
+import json
+import re
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# One document sent to Claude: (bytes, mime_type). A capture may be sent as
+# several parts, e.g. the tiles of a tall screenshot.
+DocumentPart = tuple[bytes, str]
+
+
+def build_content_block(content: bytes, mime_type: str) -> dict:
+    """Wrap raw PNG or PDF bytes, or UTF-8 text, in the matching Claude content block."""
+    if mime_type == "text/plain":
+        return {
+            "type": "text",
+            "text": f"<document>\n{content.decode('utf-8', errors='replace')}\n</document>",
+        }
+
+    encoded = base64.standard_b64encode(content).decode("utf-8")
+
+    if mime_type == "application/pdf":
+        return {
+            "type": "document",
+            "source": {
+                "type": "base64",
+                "media_type": "application/pdf",
+                "data": encoded,
+            },
+        }
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": mime_type,
+            "data": encoded,
+        },
+    }
+
+
+def build_content_blocks(parts: list[DocumentPart]) -> list[dict]:
+    """Content blocks for every part of a document, in order."""
+    return [build_content_block(content, mime_type) for content, mime_type in parts]
+
+
+def build_system(prompt: str) -> list[dict]:
+    """The static instructions as a system block marked for prompt caching.
+
+    They come before the document, so every call with the same prompt
+    shares a cacheable prefix. The API only caches prefixes above a
+    model-specific minimum (1024+ tokens); below it the marker is ignored
+    and the usage simply shows no cache tokens.
+    """
+    return [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}]
+
+
+def log_usage(label: str, usage) -> None:
+    """Log a response's token usage, including prompt cache writes and reads."""
+    if usage is None:
+        return
+    logger.info(
+        f"{label} tokens: input={usage.input_tokens} output={usage.output_tokens} "
+        f"cache_write={getattr(usage, 'cache_creation_input_tokens', 0) or 0} "
+        f"cache_read={getattr(usage, 'cache_read_input_tokens', 0) or 0}"
+    )
+
+
+def describe_parts(parts: list[DocumentPart]) -> str:
+    """Short log description, e.g. "image/webp ×3, 182344 bytes"."""
+    mime_types = sorted({mime_type for _, mime_type in parts})
+    count = f" ×{len(parts)}" if len(parts) > 1 else ""
+    return f"{', '.join(mime_types)}{count}, {sum(len(content) for content, _ in parts)} bytes"
+
+
+def parse_json_response(text: str):
+    """Strip any markdown code fence Claude wrapped around its answer and parse it.
+
+    Raises json.JSONDecodeError if the remaining text isn't valid JSON.
+    """
+    raw = text.strip()
+    raw = re.sub(r"^```[a-z]*\s*", "", raw)
+    raw = re.sub(r"\s*```$", "", raw)
+    return json.loads(raw.strip())
@@ -0,0 +1,367 @@
+"""
+HSA Tracker — bulk backfill.
+
+Runs past mail through the same pipeline as main.py, from one of:
+
+    python backfill.py imap --since 2025-01-01 --before 2026-01-01 [--account user] [--mailbox INBOX]
+    python backfill.py mbox path/to/archive.mbox [--since …] [--before …]
+    python backfill.py eml path/to/folder [--since …] [--before …]
+
+Every message is parsed with parse_message and handed to the Pipeline, so
+--workers emails are captured, classified and extracted in parallel and
+already-processed Message-IDs are skipped as usual. Finished items are
+recorded in a checkpoint table, so an interrupted backfill resumes where it
+stopped without downloading or parsing finished mail again. Progress and
+throughput are logged every PROGRESS_SECONDS.
+
+IMAP messages are fetched with BODY.PEEK[], so they are not marked as read.
+Stop at any time with Ctrl+C; emails already queued are finished first.
+"""
+
+import argparse
+import functools
+import hashlib
+import mailbox
+import os
+import ssl
+import threading
+import time
+from datetime import date
+from typing import Callable, Iterator
+
+from imapclient import IMAPClient
+from imapclient.exceptions import IMAPClientAbortError
+
+from config import load_settings
+from agent.hsa_agent import HSAAgent
+from agent.pipeline import Pipeline
+from email_monitor.message_parser import parse_message
+from email_monitor.uid_sync import FetchOptions, plan_chunks
+from main import build_agent, close_agent
+from models.data_models import EmailMessage
+from utils.backfill_checkpoint import BackfillCheckpoint
+from utils.logger import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+PROGRESS_SECONDS = 10
+MAX_RECONNECTS = 5              # dropped IMAP connections reopened in a row before giving up
+RECONNECT_BACKOFF_SECONDS = 5   # doubled per consecutive reconnect
+
+# A source item: (checkpoint key, raw RFC 822 bytes)
+Item = tuple[str, bytes]
+
+
+class Progress:
+    """Counts finished emails and logs progress, throughput and an ETA.
+
+    The total grows as each source is opened, so with several IMAP accounts
+    the ETA covers only the accounts opened so far.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._report, daemon=True, name="backfill-progress")
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+        self.log()
+
+    def add_total(self, items: int) -> None:
+        with self._lock:
+            self.total += items
+
+    def count(self, succeeded: bool | None) -> None:
+        """Count one email: True processed, False failed, None skipped."""
+        with self._lock:
+            if succeeded is None:
+                self.skipped += 1
+            elif succeeded:
+                self.done += 1
+            else:
+                self.failed += 1
+
+    def log(self) -> None:
+        with self._lock:
+            done, failed, skipped, total = self.done, self.failed, self.skipped, self.total
+        elapsed = time.monotonic() - self._started
+        finished = done + failed + skipped
+        rate = (done + failed) / elapsed if elapsed else 0.0
+        remaining = max(total - finished, 0)
+        eta = f"{remaining / rate / 60:.1f} min" if rate else "unknown"
+        percent = finished / total if total else 1.0
+        logger.info(
+            f"Backfill: {finished}/{total} ({percent:.1%}) — processed={done} failed={failed} "
+            f"skipped={skipped} — {rate:.2f} msg/s, ETA {eta}"
+        )
+
+    def _report(self) -> None:
+        while not self._stop_event.wait(PROGRESS_SECONDS):
+            self.log()
+
+
+# ── Sources — each is opened when its turn comes and returns (item count, items)
+
+Source = Callable[[], tuple[int, Iterator[Item]]]
+
+
+def imap_source(account: dict, mailbox_name: str, since: date, before: date | None,
+                checkpoint: BackfillCheckpoint, options: FetchOptions) -> Source:
+    """Messages received in [since, before) in one IMAP mailbox, oldest first.
+
+    Nothing connects until the source is opened, so later accounts don't sit
+    idle (and get disconnected) while earlier ones are processed. A dropped
+    connection is reopened, up to MAX_RECONNECTS times in a row, and the
+    interrupted command repeated.
+    """
+    label = f"{account['username']}/{mailbox_name}"
+
+    def connect() -> tuple[IMAPClient, int]:
+        client = IMAPClient(account["host"], port=account["port"], ssl=True, ssl_context=ssl.create_default_context())
+        try:
+            client.login(account["username"], account["password"])
+            select_info = client.select_folder(mailbox_name, readonly=True)
+        except Exception:
+            _logout(client)
+            raise
+        return client, int(select_info.get(b"UIDVALIDITY", 0))
+
+    def open_source() -> tuple[int, Iterator[Item]]:
+        client, uidvalidity = connect()
+        prefix = f"imap:{account['username']}@{account['host']}/{mailbox_name}:{uidvalidity}:"
+
+        def call(command):
+            """Run command(client), reconnecting if the connection drops."""
+            nonlocal client
+            for attempt in range(MAX_RECONNECTS + 1):
+                try:
+                    return command(client)
+                except (IMAPClientAbortError, OSError) as e:
+                    if attempt == MAX_RECONNECTS:
+                        raise
+                    pause = RECONNECT_BACKOFF_SECONDS * 2 ** attempt
+                    logger.warning(f"Lost connection to {label}: {e} — reconnecting in {pause}s")
+                    _logout(client)
+                    time.sleep(pause)
+                    try:
+                        client, reconnected_uidvalidity = connect()
+                    except (IMAPClientAbortError, OSError) as e:
+                        logger.warning(f"Reconnecting to {label} failed: {e}")
+                        continue
+                    if reconnected_uidvalidity != uidvalidity:
+                        raise RuntimeError(f"UIDVALIDITY of {label} changed during the backfill — run it again")
+
+        try:
+            criteria = ["SINCE", since] + (["BEFORE", before] if before else [])
+            uids = sorted(call(lambda c: c.search(criteria)))
+            done = checkpoint.done_keys(prefix)
+            todo = [uid for uid in uids if f"{prefix}{uid}" not in done]
+        except Exception:
+            _logout(client)
+            raise
+        logger.info(f"{label}: {len(uids)} message(s) in range, {len(uids) - len(todo)} already backfilled")
+
+        def items() -> Iterator[Item]:
+            try:
+                sizes = {}
+                if todo:
+                    response = call(lambda c: c.fetch(todo, ["RFC822.SIZE"]))
+                    sizes = {uid: data.get(b"RFC822.SIZE", 0) for uid, data in response.items()}
+                for action, chunk in plan_chunks(todo, sizes, options):
+                    if action == "skip":
+                        continue
+                    # BODY.PEEK leaves \Seen alone
+                    response = call(lambda c: c.fetch(chunk, ["BODY.PEEK[]"]))
+                    for uid in chunk:
+                        raw = response.pop(uid, {}).get(b"BODY[]")
+                        if raw:
+                            yield f"{prefix}{uid}", raw
+                        else:
+                            logger.warning(f"No body returned for UID {uid} of {label} — skipping")
+            finally:
+                _logout(client)
+
+        return len(todo), items()
+
+    return open_source
+
+
+def _logout(client: IMAPClient) -> None:
+    try:
+        client.logout()
+    except Exception:
+        pass
+
+
+def mbox_source(path: str, checkpoint: BackfillCheckpoint) -> tuple[int, Iterator[Item]]:
+    """Every message in an mbox file, in file order."""
+    path = os.path.abspath(path)
+    prefix = f"mbox:{path}:"
+    box = mailbox.mbox(path, create=False)
+    done = checkpoint.done_keys(prefix)
+    todo = [key for key in box.keys() if f"{prefix}{key}" not in done]
+
+    def items() -> Iterator[Item]:
+        try:
+            for key in todo:
+                yield f"{prefix}{key}", box.get_bytes(key)
+        finally:
+            box.close()
+
+    return len(todo), items()
+
+
+def eml_source(directory: str, checkpoint: BackfillCheckpoint) -> tuple[int, Iterator[Item]]:
+    """Every .eml file under a directory, in path order."""
+    directory = os.path.abspath(directory)
+    prefix = f"eml:{directory}{os.sep}"
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory)
+        for name in names if name.lower().endswith(".eml")
+    )
+    done = checkpoint.done_keys(prefix)
+    todo = [path for path in paths if f"eml:{path}" not in done]
+
+    def items() -> Iterator[Item]:
+        for path in todo:
+            with open(path, "rb") as f:
+                yield f"eml:{path}", f.read()
+
+    return len(todo), items()
+
+
+# ── Backfill ─────────────────────────────────────────────────────────────────
+
+def run(agent: HSAAgent, sources: list[Source], checkpoint: BackfillCheckpoint,
+        workers: dict[str, int], queue_size: int, since: date | None = None, before: date | None = None) -> None:
+    """Parse every item, hand it to the pipeline and checkpoint it once processed."""
+    progress = Progress()
+    pending: dict[str, list[str]] = {}   # Message-ID → checkpoint keys awaiting it
+    pending_lock = threading.Lock()
+
+    def on_done(message: EmailMessage, succeeded: bool) -> None:
+        with pending_lock:
+            keys = pending.pop(message.message_id, [])
+        if succeeded:
+            for key in keys:
+                checkpoint.mark_done(key, message.message_id)
+        progress.count(succeeded)
+
+    pipeline = Pipeline(agent, workers=workers, queue_size=queue_size, on_done=on_done)
+    pipeline.start()
+    progress.start()
+    try:
+        for open_source in sources:
+            try:
+                total, items = open_source()
+            except Exception as e:
+                logger.error(f"Could not open backfill source: {e} — skipping it")
+                continue
+            progress.add_total(total)
+            for key, raw in _until_failure(items):
+                try:
+                    message = parse_message(raw)
+                except Exception as e:
+                    logger.error(f"Failed to parse {key}: {e}")
+                    progress.count(False)
+                    continue
+                if not message.message_id:
+                    # Stable across runs, so dedup and the checkpoint still work
+                    message.message_id = f"<backfill-{hashlib.sha256(raw).hexdigest()[:16]}>"
+                if (since and message.date < since) or (before and message.date >= before):
+                    progress.count(None)
+                    continue
+
+                with pending_lock:
+                    pending.setdefault(message.message_id, []).append(key)
+                if not pipeline.submit(message):
+                    # Duplicate: mark it done now if it was processed before,
+                    # otherwise the copy in flight marks it when it finishes
+                    if agent.dedup.already_processed(message.message_id):
+                        with pending_lock:
+                            keys = pending.get(message.message_id, [])
+                            if key in keys:
+                                keys.remove(key)
+                            if not keys:
+                                pending.pop(message.message_id, None)
+                        checkpoint.mark_done(key, message.message_id)
+                    progress.count(None)
+    except KeyboardInterrupt:
+        logger.info("Interrupted — finishing emails already queued…")
+    finally:
+        pipeline.stop()
+        progress.stop()
+
+
+def _until_failure(items: Iterator[Item]) -> Iterator[Item]:
+    """Yield from a source until it raises; later sources still run."""
+    try:
+        yield from items
+    except Exception as e:
+        logger.error(f"Backfill source failed: {e} — continuing with the next one; re-run to resume it")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill past mail through the HSA pipeline.")
+    parser.add_argument("source", choices=["imap", "mbox", "eml"])
+    parser.add_argument("path", nargs="?", help="mbox file or .eml directory")
+    parser.add_argument("--since", type=date.fromisoformat, help="first day to include (YYYY-MM-DD)")
+    parser.add_argument("--before", type=date.fromisoformat, help="first day to exclude (YYYY-MM-DD)")
+    parser.add_argument("--account", help="IMAP username (default: every configured account)")
+    parser.add_argument("--mailbox", help="IMAP mailbox (default: the account's configured mailbox)")
+    parser.add_argument("--workers", type=int, help="capture, classify and extract workers")
+    args = parser.parse_args()
+    if args.source == "imap" and not args.since:
+        parser.error("imap backfill needs --since")
+    if args.source != "imap" and not args.path:
+        parser.error(f"{args.source} backfill needs a path")
+
+    settings = load_settings()
+    setup_logging(log_level=settings.log_level, log_file=settings.log_file or "")
+    logger.info(f"HSA Tracker backfill starting ({args.source})…")
+
+    checkpoint = BackfillCheckpoint(db_path=settings.dedup_db_path)
+    if args.source == "imap":
+        accounts = [a for a in settings.imap_accounts if not args.account or a["username"] == args.account]
+        if not accounts:
+            parser.error(f"no configured IMAP account named {args.account}")
+        options = FetchOptions(
+            chunk_bytes=settings.imap_fetch_chunk_mb * 1024 * 1024,
+            max_message_bytes=settings.imap_max_message_mb * 1024 * 1024,
+        )
+        sources = [
+            imap_source(account, args.mailbox or account["mailbox"], args.since, args.before, checkpoint, options)
+            for account in accounts
+        ]
+        # The server already filtered by date
+        since, before = None, None
+    else:
+        source = mbox_source if args.source == "mbox" else eml_source
+        sources = [functools.partial(source, args.path, checkpoint)]
+        since, before = args.since, args.before
+
+    workers = dict(settings.pipeline_workers)
+    if args.workers:
+        workers.update(capture=args.workers, classify=args.workers, extract=args.workers)
+
+    agent = build_agent(settings)
+    try:
+        run(agent, sources, checkpoint, workers, settings.pipeline_queue_size, since, before)
+    finally:
+        close_agent(agent)
+        checkpoint.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import re
+from html.parser import HTMLParser
+
+# Tags whose contents are never visible text
+SKIPPED_TAGS = {"script", "style", "head", "title", "noscript", "template", "svg"}
+
+# Tags that start a new line when rendered
+BLOCK_TAGS = {
+    "p", "div", "br", "tr", "li", "ul", "ol", "table", "section", "article",
+    "header", "footer", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "blockquote",
+}
+
+
+def html_to_text(html: str, max_chars: int = 20000) -> str:
+    """Reduce email HTML to the text a reader would see.
+
+    Drops scripts, styles and markup, keeps line breaks at block elements
+    and table rows, separates table cells with " | ", and collapses runs
+    of whitespace. Entities are decoded. The result is capped at max_chars.
+    """
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+
+    text = "".join(parser.chunks)
+    text = re.sub(r"[ \t\r\f\v ]+", " ", text)
+    text = re.sub(r" *\n[ \n]*", "\n", text)
+    return text.strip()[:max_chars]
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks: list[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.chunks.append("\n")
+        elif tag in ("td", "th"):
+            self.chunks.append(" | ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.chunks.append(data)
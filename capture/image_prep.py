@@ -0,0 +1,86 @@
+from io import BytesIO
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Claude downsamples anything much above ~1.15 megapixels, so a tile of
+# 1000 × 1150 px is about the most detail that survives.
+DEFAULT_MAX_WIDTH = 1000
+DEFAULT_TILE_HEIGHT = 1150
+DEFAULT_MAX_TILES = 5
+
+MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+CROP_PADDING = 16
+
+
+def prepare_image(
+    png: bytes,
+    max_width: int = DEFAULT_MAX_WIDTH,
+    tile_height: int = DEFAULT_TILE_HEIGHT,
+    max_tiles: int = DEFAULT_MAX_TILES,
+    image_format: str = "WEBP",
+    quality: int = 80,
+) -> list[tuple[bytes, str]]:
+    """Shrink a full-page screenshot to what Claude will actually use.
+
+    1. Crop away the empty background around the content.
+    2. Downscale to max_width.
+    3. Split very tall captures into tiles of tile_height, dropping blank
+       tiles and keeping at most max_tiles (receipt totals sit near the top).
+    4. Re-encode each tile as WEBP or JPEG.
+
+    Returns a list of (bytes, mime_type) tiles, top to bottom.
+    """
+    from PIL import Image, ImageChops
+
+    image_format = image_format.upper()
+    mime_type = MIME_TYPES[image_format]
+
+    img = Image.open(BytesIO(png)).convert("RGB")
+    original_size = img.size
+
+    # ── 1. Crop to content, using the top-left pixel as the background ──
+    background = Image.new("RGB", img.size, img.getpixel((0, 0)))
+    bbox = ImageChops.difference(img, background).getbbox()
+    if bbox:
+        left, top, right, bottom = bbox
+        img = img.crop((
+            max(0, left - CROP_PADDING),
+            max(0, top - CROP_PADDING),
+            min(img.width, right + CROP_PADDING),
+            min(img.height, bottom + CROP_PADDING),
+        ))
+
+    # ── 2. Downscale ─────────────────────────────────────────────────────
+    if img.width > max_width:
+        img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+
+    # ── 3. Tile ──────────────────────────────────────────────────────────
+    tiles = []
+    for top in range(0, img.height, tile_height):
+        tile = img.crop((0, top, img.width, min(img.height, top + tile_height)))
+        tile_background = Image.new("RGB", tile.size, tile.getpixel((0, 0)))
+        if ImageChops.difference(tile, tile_background).getbbox() is None:
+            continue   # blank stretch between sections
+        tiles.append(tile)
+    if not tiles:
+        tiles = [img]
+    if len(tiles) > max_tiles:
+        logger.info(f"Screenshot has {len(tiles)} tiles — keeping the top {max_tiles}")
+        tiles = tiles[:max_tiles]
+
+    # ── 4. Re-encode ─────────────────────────────────────────────────────
+    encoded = []
+    for tile in tiles:
+        buf = BytesIO()
+        tile.save(buf, format=image_format, quality=quality)
+        encoded.append((buf.getvalue(), mime_type))
+
+    prepared_bytes = sum(len(data) for data, _ in encoded)
+    logger.info(
+        f"Prepared screenshot {original_size[0]}×{original_size[1]} → {len(encoded)} "
+        f"{image_format} tile(s) at {img.width}px wide: {len(png)} → {prepared_bytes} bytes "
+        f"({len(png) - prepared_bytes} saved)"
+    )
+    return encoded
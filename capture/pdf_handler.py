@@ -1,3 +1,8 @@
+import re
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+
 from models.data_models import EmailMessage
 from utils.logger import get_logger
 
@@ -5,6 +10,37 @@ logger = get_logger(__name__)
 
 PDF_MIME_TYPES = {"application/pdf", "application/x-pdf"}
 
+MAX_TEXT_PAGES = 50
+
+# Phrases that mark the page of a bill holding the total, weighted by how
+# strongly they point at it
+RELEVANCE_PATTERNS = [
+    (re.compile(r"amount due|balance due|total due|you owe|patient responsibility|please pay", re.I), 5.0),
+    (re.compile(r"\btotal\b|\bbalance\b|\bcopay|co-pay|deductible|coinsurance", re.I), 2.0),
+    (re.compile(r"date of service|service date|statement date|\bdos\b", re.I), 2.0),
+    (re.compile(r"\brx\b|prescription|pharmacy|patient|provider", re.I), 1.0),
+    (re.compile(r"\$\s?\d[\d,]*\.\d{2}"), 0.5),
+]
+MIN_PAGE_TEXT_CHARS = 100   # pages with less text may be scans — keep their images
+
+
+@dataclass
+class PdfTextLayer:
+    """The embedded text of a PDF plus stats used to judge whether it's usable."""
+    text: str
+    page_count: int
+    pages_with_text: int
+    char_count: int
+
+    @property
+    def pages_read(self) -> int:
+        """Pages the text was taken from (at most MAX_TEXT_PAGES)."""
+        return min(self.page_count, MAX_TEXT_PAGES)
+
+    @property
+    def chars_per_page(self) -> float:
+        return self.char_count / self.pages_read if self.page_count else 0.0
+
 
 def extract_pdfs(message: EmailMessage) -> list[bytes]:
     """Return the raw bytes of any PDF attachments found in the email.
@@ -27,3 +63,123 @@ def extract_pdfs(message: EmailMessage) -> list[bytes]:
 def _is_valid_pdf(content: bytes) -> bool:
     """Quick check that the bytes start with the PDF magic number."""
     return content[:4] == b"%PDF"
+
+
+def extract_text_layer(content: bytes) -> Optional[PdfTextLayer]:
+    """Pull the embedded text out of a PDF with pypdf.
+
+    Digitally generated bills carry a full text layer; scanned ones have
+    little or none. Pages are separated by "--- Page N ---" markers, and
+    only the first MAX_TEXT_PAGES pages are read.
+
+    Returns None if the PDF can't be read (corrupt or password-protected).
+    """
+    from pypdf import PdfReader
+
+    try:
+        reader = PdfReader(BytesIO(content))
+        if reader.is_encrypted and not reader.decrypt(""):
+            logger.debug("PDF is password-protected — no text layer")
+            return None
+        page_count = len(reader.pages)
+        page_texts = [(page.extract_text() or "").strip() for page in reader.pages[:MAX_TEXT_PAGES]]
+    except Exception as e:
+        logger.warning(f"Could not read PDF text layer: {e}")
+        return None
+
+    text = "\n\n".join(
+        f"--- Page {number} ---\n{page_text}" for number, page_text in enumerate(page_texts, start=1)
+    )
+    layer = PdfTextLayer(
+        text=text,
+        page_count=page_count,
+        pages_with_text=sum(1 for page_text in page_texts if page_text),
+        char_count=sum(len(page_text) for page_text in page_texts),
+    )
+    logger.debug(
+        f"PDF text layer: {layer.page_count} page(s), {layer.pages_with_text} with text, "
+        f"{layer.char_count} chars ({layer.chars_per_page:.0f}/page)"
+    )
+    return layer
+
+
+def is_text_layer_usable(layer: Optional[PdfTextLayer], min_chars_per_page: int = 200) -> bool:
+    """Decide whether a text layer is good enough to send instead of the PDF.
+
+    Rejects scanned PDFs (little or no text on most pages) and layers whose
+    text is mostly symbols, which happens with broken font encodings.
+    """
+    if layer is None or not layer.page_count:
+        return False
+    if layer.pages_with_text < 0.8 * layer.pages_read:
+        return False
+    if layer.chars_per_page < min_chars_per_page:
+        return False
+    readable = sum(1 for ch in layer.text if ch.isalnum() or ch.isspace() or ch in ".,$-/:#()%")
+    return readable / max(1, len(layer.text)) >= 0.85
+
+
+def score_page(text: str) -> float:
+    """How likely a page is to hold the receipt details (date, item, total)."""
+    return sum(weight * len(pattern.findall(text)) for pattern, weight in RELEVANCE_PATTERNS)
+
+
+def trim_pdf(content: bytes, max_pages: int = 2) -> Optional[bytes]:
+    """Build a smaller PDF holding only the pages most likely to matter.
+
+    Hospital statements and EOBs often run 10-30 pages with the total on
+    page one or two. Pages are scored with score_page(); the first page is
+    always kept and the best-scoring others fill up to max_pages, in their
+    original order. Scanned PDFs (no text to score) keep their first pages.
+
+    Content streams of pages with a text layer are compressed. Images and
+    embedded fonts are kept: Claude renders PDF pages to images, so
+    stripping fonts would garble the glyphs, and OCR'd scans carry their
+    visible content as a full-page image under an invisible text layer.
+
+    Returns None if the PDF can't be read or trimming wouldn't shrink it.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    try:
+        reader = PdfReader(BytesIO(content))
+        if reader.is_encrypted and not reader.decrypt(""):
+            return None
+        page_texts = [(page.extract_text() or "") for page in reader.pages]
+    except Exception as e:
+        logger.warning(f"Could not read PDF for trimming: {e}")
+        return None
+
+    page_count = len(page_texts)
+    if page_count == 0:
+        return None
+
+    ranked = sorted(range(1, page_count), key=lambda i: score_page(page_texts[i]), reverse=True)
+    selected = sorted([0] + ranked[:max(0, max_pages - 1)])
+    text_pages = {i for i in selected if len(page_texts[i].strip()) >= MIN_PAGE_TEXT_CHARS}
+
+    if len(selected) == page_count and not text_pages:
+        return None
+
+    try:
+        writer = PdfWriter()
+        for i in selected:
+            writer.add_page(reader.pages[i])
+        for position, i in enumerate(selected):
+            if i in text_pages:
+                writer.pages[position].compress_content_streams()
+        buf = BytesIO()
+        writer.write(buf)
+    except Exception as e:
+        logger.warning(f"Could not trim PDF: {e}")
+        return None
+
+    trimmed = buf.getvalue()
+    if len(trimmed) >= len(content):
+        return None
+
+    logger.info(
+        f"Trimmed PDF to page(s) {[i + 1 for i in selected]} of {page_count}: "
+        f"{len(content)} → {len(trimmed)} bytes"
+    )
+    return trimmed
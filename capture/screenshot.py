@@ -1,7 +1,31 @@
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from utils.asset_cache import AssetCache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+VIEWPORT = {"width": 900, "height": 1200}
+
+# Offline rendering: resource types that never affect how an email looks
+BLOCKED_RESOURCE_TYPES = {"script", "font", "media", "websocket", "xhr", "fetch", "eventsource", "manifest"}
+CACHEABLE_RESOURCE_TYPES = {"image", "stylesheet"}
+MAX_ASSET_BYTES = 5 * 1024 * 1024
+
+# Open-tracking pixels and analytics beacons — blocked outright
+TRACKER_PATTERN = re.compile(
+    r"doubleclick\.net|google-analytics\.com|googletagmanager\.com|"
+    r"list-manage\.com/track|mandrillapp\.com/track|/wf/open|/track/open|"
+    r"/open\.(gif|png)|[/._-](pixel|beacon)[/._?-]",
+    re.IGNORECASE,
+)
+
+_STOP = object()     # sentinel that tells a render thread to exit
+
 
 def render_email_to_screenshot(html: str, text_fallback: str = "") -> bytes:
     """Render email HTML to a PNG screenshot using a headless browser.
@@ -11,34 +35,250 @@ def render_email_to_screenshot(html: str, text_fallback: str = "") -> bytes:
     would display it. Returns PNG bytes.
 
     Falls back to a plain-text image via Pillow if HTML is empty.
+
+    This starts and tears down a browser on every call; long-running
+    processes should use ScreenshotRenderer instead.
     """
     from playwright.sync_api import sync_playwright
 
-    content = html or text_fallback
-    if not content:
+    if not html and not text_fallback:
         raise ValueError("Email has neither HTML body nor text body to screenshot")
 
-    if not html and text_fallback:
+    if not html:
         logger.debug("No HTML body — rendering plain text as image")
         return _text_to_image(text_fallback)
 
     logger.debug("Rendering email HTML to screenshot via Playwright")
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
-        page = browser.new_page(viewport={"width": 900, "height": 1200})
-
-        # Wrap raw HTML in a basic page if it lacks a doctype
-        if not content.strip().lower().startswith("<!doctype") and "<html" not in content.lower():
-            content = f"<html><body style='font-family:sans-serif;padding:20px'>{content}</body></html>"
-
-        page.set_content(content, wait_until="networkidle")
-        screenshot = page.screenshot(full_page=True)
+        page = browser.new_page(viewport=VIEWPORT)
+        screenshot = _screenshot_page(page, html)
         browser.close()
 
     logger.debug(f"Screenshot captured: {len(screenshot)} bytes")
     return screenshot
 
 
+class ScreenshotRenderer:
+    """Long-lived screenshot service that keeps warm Chromium browsers.
+
+    Playwright's sync API objects belong to the thread that created them,
+    so the renderer owns a small pool of render threads, each with its own
+    browser and a reusable page. render() may be called from any number of
+    threads; calls queue up and are served by whichever render thread is free.
+
+    Each thread recycles its page after `recycle_after` renders (bounding
+    memory growth) or after a failed render, and relaunches its browser if
+    it has crashed.
+
+    In offline mode every network request is intercepted: scripts, fonts
+    and known trackers are blocked, images and stylesheets are served from
+    the AssetCache (fetched once on a miss), and the whole render — network
+    included — must fit in `budget_seconds`. Whatever has loaded when the
+    budget runs out is screenshotted, so render latency is bounded.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 2,
+        recycle_after: int = 100,
+        timeout_seconds: float = 120,
+        offline: bool = False,
+        asset_cache: AssetCache | None = None,
+        budget_seconds: float = 10,
+    ):
+        self.pool_size = max(1, pool_size)
+        self.recycle_after = recycle_after
+        self.timeout_seconds = timeout_seconds
+        self.offline = offline
+        self.asset_cache = asset_cache
+        self.budget_seconds = budget_seconds
+        self._jobs: queue.Queue = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the render threads. Called automatically on first render()."""
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.pool_size):
+                thread = threading.Thread(target=self._render_loop, daemon=True, name=f"renderer-{i}")
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Screenshot renderer started with {self.pool_size} browser(s)")
+
+    def render(self, html: str, text_fallback: str = "") -> bytes:
+        """Same contract as render_email_to_screenshot(), using a warm browser."""
+        if not html and not text_fallback:
+            raise ValueError("Email has neither HTML body nor text body to screenshot")
+
+        if not html:
+            logger.debug("No HTML body — rendering plain text as image")
+            return _text_to_image(text_fallback)
+
+        self.start()
+        future: Future = Future()
+        self._jobs.put((html, future))
+        return future.result(timeout=self.timeout_seconds)
+
+    def close(self) -> None:
+        """Stop the render threads and close their browsers."""
+        with self._start_lock:
+            for _ in self._threads:
+                self._jobs.put(_STOP)
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+        logger.info("Screenshot renderer stopped")
+
+    def _render_loop(self) -> None:
+        from playwright.sync_api import sync_playwright
+
+        with sync_playwright() as p:
+            browser = None
+            page = None
+            renders = 0
+            deadline = [0.0]   # monotonic deadline of the current render, read by the route handler
+
+            while True:
+                job = self._jobs.get()
+                if job is _STOP:
+                    break
+                html, future = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                try:
+                    if browser is None or not browser.is_connected():
+                        browser = p.chromium.launch(headless=True)
+                        logger.debug(f"{threading.current_thread().name}: launched Chromium")
+                    if page is None:
+                        page = self._new_page(browser, deadline)
+
+                    started = time.monotonic()
+                    if self.offline:
+                        deadline[0] = started + self.budget_seconds
+                        screenshot = _screenshot_page_within(page, html, deadline[0])
+                    else:
+                        screenshot = _screenshot_page(page, html)
+                    logger.debug(
+                        f"Screenshot captured: {len(screenshot)} bytes in {time.monotonic() - started:.2f}s"
+                    )
+                    future.set_result(screenshot)
+                    renders += 1
+                except Exception as e:
+                    future.set_exception(e)
+                    _close_quietly(page)
+                    page = None
+                    renders = 0
+                    if browser is not None and not browser.is_connected():
+                        logger.warning(f"Render failed ({e}) — browser crashed, relaunching")
+                        browser = None
+                    else:
+                        logger.warning(f"Render failed ({e}) — recycling page")
+                    continue
+
+                if renders >= self.recycle_after:
+                    logger.debug(f"{threading.current_thread().name}: recycling page after {renders} renders")
+                    _close_quietly(page)
+                    page = None
+                    renders = 0
+
+            _close_quietly(browser)
+
+    def _new_page(self, browser, deadline: list[float]):
+        """Open a page; in offline mode, with JavaScript off and every request intercepted."""
+        if not self.offline:
+            return browser.new_page(viewport=VIEWPORT)
+
+        page = browser.new_page(viewport=VIEWPORT, java_script_enabled=False)
+        page.route("**/*", lambda route: self._handle_route(route, deadline[0]))
+        return page
+
+    def _handle_route(self, route, deadline: float) -> None:
+        """Serve, fetch or block one request made while rendering offline."""
+        request = route.request
+        url = request.url
+
+        if url.startswith(("data:", "about:")):
+            route.continue_()
+            return
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or TRACKER_PATTERN.search(url):
+            route.abort()
+            return
+        if request.resource_type not in CACHEABLE_RESOURCE_TYPES:
+            route.abort()
+            return
+
+        if self.asset_cache:
+            cached = self.asset_cache.get(url)
+            if cached:
+                content_type, body = cached
+                route.fulfill(status=200, content_type=content_type, body=body)
+                return
+
+        remaining_ms = (deadline - time.monotonic()) * 1000
+        if remaining_ms <= 0:
+            route.abort()
+            return
+
+        try:
+            response = route.fetch(timeout=remaining_ms)
+            body = response.body()
+        except Exception as e:
+            logger.debug(f"Asset fetch failed for {url}: {e}")
+            route.abort()
+            return
+
+        content_type = response.headers.get("content-type", "application/octet-stream")
+        if self.asset_cache and response.ok and len(body) <= MAX_ASSET_BYTES:
+            self.asset_cache.put(url, content_type, body)
+        route.fulfill(response=response, body=body)
+
+
+def _wrap_html(html: str) -> str:
+    """Wrap raw HTML in a basic page if it lacks a doctype."""
+    if not html.strip().lower().startswith("<!doctype") and "<html" not in html.lower():
+        html = f"<html><body style='font-family:sans-serif;padding:20px'>{html}</body></html>"
+    return html
+
+
+def _screenshot_page(page, html: str) -> bytes:
+    """Load HTML into an open Playwright page and take a full-page screenshot."""
+    page.set_viewport_size(VIEWPORT)
+    page.set_content(_wrap_html(html), wait_until="networkidle")
+    return page.screenshot(full_page=True)
+
+
+def _screenshot_page_within(page, html: str, deadline: float) -> bytes:
+    """Like _screenshot_page, but stop waiting for assets at the deadline.
+
+    The DOM is always loaded; slow images are simply missing from the shot.
+    """
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+    page.set_viewport_size(VIEWPORT)
+    page.set_content(_wrap_html(html), wait_until="domcontentloaded")
+    remaining_ms = (deadline - time.monotonic()) * 1000
+    if remaining_ms > 0:
+        try:
+            page.wait_for_load_state("load", timeout=remaining_ms)
+        except PlaywrightTimeoutError:
+            logger.debug("Render budget exhausted — screenshotting what has loaded")
+    return page.screenshot(full_page=True, animations="disabled")
+
+
+def _close_quietly(resource) -> None:
+    """Close a Playwright browser or page, ignoring errors from a dead process."""
+    if resource is None:
+        return
+    try:
+        resource.close()
+    except Exception:
+        pass
+
+
 def _text_to_image(text: str) -> bytes:
     """Convert plain text to a PNG image using Pillow as a last resort."""
     from io import BytesIO
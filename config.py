@@ -1,9 +1,14 @@
+import json
 import os
+import re
 from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# The processing pipeline's stages, in order (see agent.pipeline)
+PIPELINE_STAGES = ("capture", "classify", "extract", "upload", "log")
+
 
 def _require(key: str) -> str:
     val = os.getenv(key)
@@ -16,40 +21,119 @@ def _optional(key: str, default: str = "") -> str:
     return os.getenv(key, default)
 
 
+def _flag(key: str, default: bool = False) -> bool:
+    return _optional(key, "true" if default else "false").strip().lower() in ("1", "true", "yes", "on")
+
+
 def _load_imap_accounts() -> list[dict]:
-    """Load one or more IMAP account configs from env vars.
-    Account 1 uses plain keys (IMAP_HOST, etc.).
-    Additional accounts use suffixed keys (IMAP_HOST_2, IMAP_HOST_3, etc.).
+    """Load one or more IMAP account configs.
+
+    If IMAP_ACCOUNTS_FILE is set, every account comes from that JSON file
+    (see _load_imap_accounts_file). Otherwise from env vars:
+    account 1 uses plain keys (IMAP_HOST, etc.), additional accounts use
+    suffixed keys (IMAP_HOST_2, IMAP_HOST_3, etc.), with no upper limit.
     """
+    accounts_file = _optional("IMAP_ACCOUNTS_FILE")
+    if accounts_file:
+        accounts = _load_imap_accounts_file(accounts_file)
+    else:
+        numbers = sorted(
+            int(match.group(1))
+            for match in (re.fullmatch(r"IMAP_HOST_(\d+)", key) for key in os.environ)
+            if match
+        )
+        accounts = []
+        for suffix in [""] + [f"_{n}" for n in numbers]:
+            host = os.getenv(f"IMAP_HOST{suffix}")
+            if not host:
+                continue
+            accounts.append({
+                "host": host,
+                "port": int(os.getenv(f"IMAP_PORT{suffix}", "993")),
+                "username": _require(f"IMAP_USERNAME{suffix}"),
+                "password": _require(f"IMAP_PASSWORD{suffix}"),
+                "mailbox": os.getenv(f"IMAP_MAILBOX{suffix}", "INBOX"),
+            })
+    if not accounts:
+        raise EnvironmentError("No IMAP accounts configured. Set at least IMAP_HOST, IMAP_USERNAME, IMAP_PASSWORD.")
+    return accounts
+
+
+def _load_imap_accounts_file(path: str) -> list[dict]:
+    """Read accounts from a JSON list, e.g.
+
+        [{"host": "imap.gmail.com", "username": "me@gmail.com", "password_env": "GMAIL_PW"},
+         {"host": "imap.mail.yahoo.com", "port": 993, "username": "kid@yahoo.com",
+          "password": "xxxx", "mailbox": "INBOX"}]
+
+    "password_env" names an env var holding the password, so the file
+    itself can stay free of secrets.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+
     accounts = []
-    for suffix in ["", "_2", "_3", "_4", "_5"]:
-        host = os.getenv(f"IMAP_HOST{suffix}")
-        if not host:
-            continue
+    for index, entry in enumerate(entries, start=1):
+        for key in ("host", "username"):
+            if not entry.get(key):
+                raise EnvironmentError(f"Account #{index} in {path} is missing '{key}'")
+        password = _require(entry["password_env"]) if entry.get("password_env") else entry.get("password")
+        if not password:
+            raise EnvironmentError(f"Account #{index} in {path} needs 'password' or 'password_env'")
         accounts.append({
-            "host": host,
-            "port": int(os.getenv(f"IMAP_PORT{suffix}", "993")),
-            "username": _require(f"IMAP_USERNAME{suffix}"),
-            "password": _require(f"IMAP_PASSWORD{suffix}"),
-            "mailbox": os.getenv(f"IMAP_MAILBOX{suffix}", "INBOX"),
+            "host": entry["host"],
+            "port": int(entry.get("port", 993)),
+            "username": entry["username"],
+            "password": password,
+            "mailbox": entry.get("mailbox", "INBOX"),
         })
-    if not accounts:
-        raise EnvironmentError("No IMAP accounts configured. Set at least IMAP_HOST, IMAP_USERNAME, IMAP_PASSWORD.")
     return accounts
 
 
+def _load_pipeline_workers() -> dict[str, int]:
+    """Parse PIPELINE_WORKERS, e.g. "capture=2,classify=4,upload=1".
+    Stages that aren't listed keep their default worker count.
+    """
+    workers = {}
+    for entry in _optional("PIPELINE_WORKERS").split(","):
+        if not entry.strip():
+            continue
+        stage, _, count = entry.partition("=")
+        stage = stage.strip()
+        if stage not in PIPELINE_STAGES:
+            raise EnvironmentError(
+                f"PIPELINE_WORKERS: unknown stage '{stage}' (expected one of {', '.join(PIPELINE_STAGES)})"
+            )
+        try:
+            workers[stage] = int(count)
+        except ValueError:
+            raise EnvironmentError(f"PIPELINE_WORKERS: '{entry.strip()}' needs a whole number, e.g. {stage}=2") from None
+        if workers[stage] < 1:
+            raise EnvironmentError(f"PIPELINE_WORKERS: {stage} needs at least 1 worker")
+    return workers
+
+
 @dataclass
 class Settings:
     # Claude
     anthropic_api_key: str
     claude_model: str
+    claude_fast_model: str      # cascade: ask this model first; "" = always use claude_model
+    cascade_band: float         # escalate when fast confidence is within this of the threshold
 
     # Email
     imap_accounts: list[dict]
 
     # Monitoring
-    monitor_mode: str           # "idle" or "poll"
-    poll_interval_minutes: int
+    monitor_mode: str           # "idle", "poll", or "async" (all accounts on one event loop)
+    poll_interval_minutes: int  # fixed interval, or the starting one when adaptive
+    poll_adaptive: bool         # shorten after new mail, back off when idle, learn busy hours
+    poll_min_seconds: int
+    poll_max_seconds: int
+    idle_fallback_failures: int # failed IDLE sessions in a row before polling instead; 0 = never
+    imap_two_phase_fetch: bool  # fetch structure first, then only bodies and PDFs
+    imap_fetch_chunk_mb: int    # most mail held in memory by one FETCH
+    imap_max_message_mb: int    # larger messages are skipped
 
     # Google
     google_credentials_file: str
@@ -58,12 +142,70 @@ class Settings:
     google_drive_folder_id: str
     google_sheets_spreadsheet_id: str
     google_sheets_sheet_name: str
+    sheets_batch_size: int                  # rows per append; 1 = write each row immediately
+    sheets_batch_max_delay_seconds: float   # longest a row waits in the buffer
+
+    # Claude rate limits (your API tier's); 0 = no limit, the default:
+    # 429s still halve the concurrency limit
+    claude_requests_per_minute: int
+    claude_input_tokens_per_minute: int
+    claude_output_tokens_per_minute: int
+    claude_max_concurrency: int     # ceiling for the adaptive in-flight limit
+    claude_timeout_seconds: float
+    claude_max_connections: int     # keep-alive pool shared by every Claude call
 
     # Agent
     hsa_confidence_threshold: float
+    prefilter_enabled: bool         # local model trained on past verdicts skips obvious non-HSA mail
+    prefilter_shadow: bool          # only log what the pre-filter would skip
+    prefilter_recall_floor: float   # share of past HSA mail that must still reach Claude
+    prefilter_min_samples: int
+    combined_mode: bool         # classify + extract in one Claude call
+    speculative_extraction: str     # "off", "senders", "pdfs" or "all": extract while classifying
+    speculative_senders: list[str]  # medical sender domains, e.g. ["cvs.com", "kp.org"]
+    speculative_workers: int
+    batch_classify: bool            # classify all of an email's documents in one Claude call
+    batch_extract: bool             # ...and extract them in the same call
+    batch_max_mb: int               # larger sets of documents are classified one by one
+    batch_max_documents: int
+
+    # Capture
+    screenshot_pool_size: int       # warm Chromium browsers; 0 = launch one per email
+    screenshot_recycle_after: int   # renders before a browser page is recycled
+    screenshot_offline: bool        # intercept requests; block trackers, cache images
+    screenshot_budget_seconds: float
+    asset_cache_dir: str
+    asset_cache_max_mb: int
+
+    # Screenshot preparation for Claude
+    image_prep_enabled: bool        # crop, downscale, tile and re-encode screenshots
+    image_max_width: int
+    image_tile_height: int
+    image_max_tiles: int
+    image_format: str               # "WEBP" or "JPEG"
+
+    # Text-first classification
+    text_first_mode: bool           # classify email text before rendering a screenshot
+    text_first_min_chars: int       # shorter text (image-only emails) is rendered instead
+
+    # PDF text layer
+    pdf_text_mode: bool             # send a PDF's text layer instead of the PDF when usable
+    pdf_min_chars_per_page: int
+    pdf_max_text_chars: int
+    pdf_max_pages: int              # trim PDFs to this many relevant pages for Claude; 0 = off
+
+    # Pipeline
+    pipeline_workers: dict[str, int]
+    pipeline_queue_size: int
+    work_queue_enabled: bool        # persist fetched emails so failures and crashes are retried
+    work_queue_max_attempts: int    # then the email moves to the dead_letters table
+    work_queue_visibility_seconds: int
 
     # Storage
     dedup_db_path: str
+    result_cache_enabled: bool
+    result_cache_max_entries: int
+    result_cache_max_age_days: int
 
     # Logging
     log_level: str
@@ -74,17 +216,73 @@ def load_settings() -> Settings:
     return Settings(
         anthropic_api_key=_require("ANTHROPIC_API_KEY"),
         claude_model=_optional("CLAUDE_MODEL", "claude-opus-4-6"),
+        claude_fast_model=_optional("CLAUDE_FAST_MODEL", ""),
+        cascade_band=float(_optional("CASCADE_BAND", "0.15")),
         imap_accounts=_load_imap_accounts(),
         monitor_mode=_optional("MONITOR_MODE", "idle").lower(),
         poll_interval_minutes=int(_optional("POLL_INTERVAL_MINUTES", "15")),
+        poll_adaptive=_flag("POLL_ADAPTIVE"),
+        poll_min_seconds=int(_optional("POLL_MIN_SECONDS", "60")),
+        poll_max_seconds=int(_optional("POLL_MAX_SECONDS", "3600")),
+        idle_fallback_failures=int(_optional("IDLE_FALLBACK_FAILURES", "3")),
+        imap_two_phase_fetch=_flag("IMAP_TWO_PHASE_FETCH"),
+        imap_fetch_chunk_mb=int(_optional("IMAP_FETCH_CHUNK_MB", "20")),
+        imap_max_message_mb=int(_optional("IMAP_MAX_MESSAGE_MB", "40")),
         google_credentials_file=_optional("GOOGLE_CREDENTIALS_FILE", "credentials/google_credentials.json"),
         google_token_file=_optional("GOOGLE_TOKEN_FILE", "credentials/google_token.json"),
         google_drive_folder_name=_optional("GOOGLE_DRIVE_FOLDER_NAME", "HSA Receipts"),
         google_drive_folder_id=_optional("GOOGLE_DRIVE_FOLDER_ID", ""),
         google_sheets_spreadsheet_id=_require("GOOGLE_SHEETS_SPREADSHEET_ID"),
         google_sheets_sheet_name=_optional("GOOGLE_SHEETS_SHEET_NAME", "HSA Log"),
+        sheets_batch_size=int(_optional("SHEETS_BATCH_SIZE", "1")),
+        sheets_batch_max_delay_seconds=float(_optional("SHEETS_BATCH_MAX_DELAY_SECONDS", "30")),
+        claude_requests_per_minute=int(_optional("CLAUDE_REQUESTS_PER_MINUTE", "0")),
+        claude_input_tokens_per_minute=int(_optional("CLAUDE_INPUT_TOKENS_PER_MINUTE", "0")),
+        claude_output_tokens_per_minute=int(_optional("CLAUDE_OUTPUT_TOKENS_PER_MINUTE", "0")),
+        claude_max_concurrency=int(_optional("CLAUDE_MAX_CONCURRENCY", "8")),
+        claude_timeout_seconds=float(_optional("CLAUDE_TIMEOUT_SECONDS", "600")),
+        claude_max_connections=int(_optional("CLAUDE_MAX_CONNECTIONS", "16")),
         hsa_confidence_threshold=float(_optional("HSA_CONFIDENCE_THRESHOLD", "0.75")),
+        prefilter_enabled=_flag("PREFILTER_ENABLED", default=True),
+        prefilter_shadow=_flag("PREFILTER_SHADOW", default=True),
+        prefilter_recall_floor=float(_optional("PREFILTER_RECALL_FLOOR", "0.99")),
+        prefilter_min_samples=int(_optional("PREFILTER_MIN_SAMPLES", "200")),
+        combined_mode=_flag("COMBINED_MODE"),
+        speculative_extraction=_optional("SPECULATIVE_EXTRACTION", "off").lower(),
+        speculative_senders=[
+            domain.strip().lower() for domain in _optional("SPECULATIVE_SENDERS").split(",") if domain.strip()
+        ],
+        speculative_workers=int(_optional("SPECULATIVE_WORKERS", "4")),
+        batch_classify=_flag("BATCH_CLASSIFY"),
+        batch_extract=_flag("BATCH_EXTRACT"),
+        batch_max_mb=int(_optional("BATCH_MAX_MB", "20")),
+        batch_max_documents=int(_optional("BATCH_MAX_DOCUMENTS", "10")),
+        screenshot_pool_size=int(_optional("SCREENSHOT_POOL_SIZE", "2")),
+        screenshot_recycle_after=int(_optional("SCREENSHOT_RECYCLE_AFTER", "100")),
+        screenshot_offline=_flag("SCREENSHOT_OFFLINE"),
+        screenshot_budget_seconds=float(_optional("SCREENSHOT_BUDGET_SECONDS", "10")),
+        asset_cache_dir=_optional("ASSET_CACHE_DIR", "data/asset_cache"),
+        asset_cache_max_mb=int(_optional("ASSET_CACHE_MAX_MB", "200")),
+        image_prep_enabled=_flag("IMAGE_PREP_ENABLED"),
+        image_max_width=int(_optional("IMAGE_MAX_WIDTH", "1000")),
+        image_tile_height=int(_optional("IMAGE_TILE_HEIGHT", "1150")),
+        image_max_tiles=int(_optional("IMAGE_MAX_TILES", "5")),
+        image_format=_optional("IMAGE_FORMAT", "WEBP").upper(),
+        text_first_mode=_flag("TEXT_FIRST_MODE"),
+        text_first_min_chars=int(_optional("TEXT_FIRST_MIN_CHARS", "200")),
+        pdf_text_mode=_flag("PDF_TEXT_MODE"),
+        pdf_min_chars_per_page=int(_optional("PDF_MIN_CHARS_PER_PAGE", "200")),
+        pdf_max_text_chars=int(_optional("PDF_MAX_TEXT_CHARS", "30000")),
+        pdf_max_pages=int(_optional("PDF_MAX_PAGES", "0")),
+        pipeline_workers=_load_pipeline_workers(),
+        pipeline_queue_size=int(_optional("PIPELINE_QUEUE_SIZE", "10")),
+        work_queue_enabled=_flag("WORK_QUEUE_ENABLED", default=True),
+        work_queue_max_attempts=int(_optional("WORK_QUEUE_MAX_ATTEMPTS", "5")),
+        work_queue_visibility_seconds=int(_optional("WORK_QUEUE_VISIBILITY_SECONDS", "900")),
         dedup_db_path=_optional("DEDUP_DB_PATH", "data/processed_messages.db"),
+        result_cache_enabled=_flag("RESULT_CACHE_ENABLED", default=True),
+        result_cache_max_entries=int(_optional("RESULT_CACHE_MAX_ENTRIES", "5000")),
+        result_cache_max_age_days=int(_optional("RESULT_CACHE_MAX_AGE_DAYS", "90")),
         log_level=_optional("LOG_LEVEL", "INFO"),
         log_file=_optional("LOG_FILE", ""),
     )
@@ -0,0 +1,71 @@
+from datetime import datetime
+from typing import Optional
+
+from utils.logger import get_logger
+from utils.sync_state import SyncStateStore
+
+logger = get_logger(__name__)
+
+ARRIVAL_DECAY = 0.98      # older arrivals fade, so the pattern follows changes in habits
+MIN_LEARNED_ARRIVALS = 10  # below this the hour-of-day pattern is ignored
+
+
+class AdaptiveScheduler:
+    """Picks how long a PollingMonitor waits before its next check.
+
+    After a check that found mail the interval drops to `min_seconds`
+    (more tends to follow: order confirmation, shipping, receipt). Every
+    empty check multiplies it by `backoff`, up to `max_seconds`.
+
+    It also learns when each account usually gets mail: a decayed count of
+    arrivals per hour of day. During hours busier than the account's
+    average, the interval is capped proportionally below `max_seconds`, so
+    a mailbox that always gets its pharmacy mail at 9am is checked often
+    around then and rarely overnight. The histogram is kept in the
+    SyncStateStore, when given, so it survives restarts.
+    """
+
+    def __init__(
+        self,
+        account: str,
+        min_seconds: float,
+        max_seconds: float,
+        start_seconds: Optional[float] = None,
+        backoff: float = 2.0,
+        store: Optional[SyncStateStore] = None,
+    ):
+        self.account = account
+        self.min_seconds = min_seconds
+        self.max_seconds = max(max_seconds, min_seconds)
+        self.backoff = backoff
+        self.store = store
+        self.interval = min(max(start_seconds or min_seconds, self.min_seconds), self.max_seconds)
+        self._hourly = (store.get_arrivals(account) if store else None) or [0.0] * 24
+
+    def record(self, new_messages: int, now: Optional[datetime] = None) -> None:
+        """Update the interval after a check that found `new_messages`."""
+        if new_messages:
+            hour = (now or datetime.now()).hour
+            self._hourly = [count * ARRIVAL_DECAY for count in self._hourly]
+            self._hourly[hour] += new_messages
+            if self.store:
+                self.store.set_arrivals(self.account, self._hourly)
+            self.interval = self.min_seconds
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_seconds)
+
+    def next_interval(self, now: Optional[datetime] = None) -> float:
+        """Seconds to wait before the next check."""
+        interval = min(self.interval, self._hour_ceiling((now or datetime.now()).hour))
+        logger.debug(f"Next check for {self.account} in {interval:.0f}s")
+        return interval
+
+    def _hour_ceiling(self, hour: int) -> float:
+        total = sum(self._hourly)
+        if total < MIN_LEARNED_ARRIVALS:
+            return self.max_seconds
+        share = self._hourly[hour] / total
+        if share <= 1 / 24:
+            return self.max_seconds
+        # An hour with 3x its fair share of mail is checked at least 3x as often
+        return max(self.min_seconds, self.max_seconds / (share * 24))
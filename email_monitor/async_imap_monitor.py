@@ -0,0 +1,235 @@
+import asyncio
+import random
+import re
+from datetime import date
+from typing import Callable, Optional
+
+import aioimaplib
+
+from email_monitor.base_monitor import BaseMonitor
+from email_monitor.message_parser import parse_message
+from email_monitor.uid_sync import FetchOptions, UIDSync, plan_chunks
+from models.data_models import EmailMessage
+from utils.logger import get_logger
+from utils.sync_state import SyncStateStore
+
+logger = get_logger(__name__)
+
+IDLE_REFRESH_SECONDS = 20 * 60   # refresh IDLE every 20 min (server limit ~29 min)
+RECONNECT_MIN_SECONDS = 5
+RECONNECT_MAX_SECONDS = 5 * 60
+COMMAND_TIMEOUT_SECONDS = 60
+
+_FETCH_HEADER = re.compile(rb"^\d+ FETCH \(")
+_UID = re.compile(rb"\bUID (\d+)")
+_SIZE = re.compile(rb"\bRFC822\.SIZE (\d+)")
+
+
+class AsyncIMAPMonitor(BaseMonitor):
+    """Monitors any number of inboxes with IMAP IDLE from one asyncio event loop.
+
+    One thread per account stops scaling at a handful of mailboxes; here
+    every account is a coroutine holding its own IDLE connection, and all of
+    them share a single thread. Each account reconnects on its own with
+    exponential backoff (plus jitter), so one flaky server never delays
+    the rest.
+
+    Uses the same UID watermark and chunked, size-checked fetching as the
+    threaded monitors. on_message runs in a worker thread so a busy
+    pipeline doesn't block the loop. Two-phase fetching is not supported
+    here; full messages are downloaded.
+    """
+
+    def __init__(
+        self,
+        accounts: list[dict],
+        sync_store: SyncStateStore | None = None,
+        fetch_options: FetchOptions | None = None,
+    ):
+        self.accounts = accounts
+        self.sync_store = sync_store
+        self.fetch_options = fetch_options or FetchOptions()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+
+    def start(self, on_message: Callable[[EmailMessage], None]) -> None:
+        """Run the event loop until stop() is called."""
+        logger.info(f"Starting async IMAP monitor for {len(self.accounts)} account(s)")
+        asyncio.run(self._run(on_message))
+
+    def stop(self) -> None:
+        if self._loop and self._stop_event:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        logger.info("Async IMAP monitor stopping")
+
+    async def _run(self, on_message: Callable[[EmailMessage], None]) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+
+        tasks = [
+            asyncio.create_task(self._watch(account, on_message), name=f"imap-{account['username']}")
+            for account in self.accounts
+        ]
+        await self._stop_event.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info("Async IMAP monitor stopped")
+
+    async def _watch(self, account: dict, on_message: Callable[[EmailMessage], None]) -> None:
+        """Keep one account connected, backing off exponentially between failures."""
+        sync = UIDSync(
+            f"{account['username']}@{account['host']}",
+            account["mailbox"],
+            store=self.sync_store,
+            options=self.fetch_options,
+        )
+        backoff = RECONNECT_MIN_SECONDS
+        while True:
+            client = None
+            try:
+                client = await self._connect(account, sync)
+                backoff = RECONNECT_MIN_SECONDS
+                await self._idle_loop(client, sync, on_message)
+            except asyncio.CancelledError:
+                await self._logout(client)
+                raise
+            except Exception as e:
+                delay = backoff * random.uniform(0.8, 1.2)
+                logger.error(f"IMAP error for {account['username']}: {e}. Reconnecting in {delay:.0f}s...")
+                await self._logout(client)
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+
+    async def _connect(self, account: dict, sync: UIDSync) -> aioimaplib.IMAP4_SSL:
+        client = aioimaplib.IMAP4_SSL(host=account["host"], port=account["port"], timeout=COMMAND_TIMEOUT_SECONDS)
+        await client.wait_hello_from_server()
+        _check(await client.login(account["username"], account["password"]), "LOGIN")
+        response = _check(await client.select(account["mailbox"]), "SELECT")
+
+        select_info = {}
+        for line in response.lines:
+            for key in (b"UIDVALIDITY", b"UIDNEXT"):
+                match = re.search(key + rb" (\d+)", bytes(line))
+                if match:
+                    select_info[key] = int(match.group(1))
+        sync.on_select(select_info)
+        logger.info(f"Connected to {account['host']} as {account['username']}")
+        return client
+
+    async def _idle_loop(self, client, sync: UIDSync, on_message: Callable[[EmailMessage], None]) -> None:
+        # Process anything that arrived while we were offline
+        await self._fetch_new(client, sync, on_message)
+
+        while True:
+            idle = await client.idle_start(timeout=IDLE_REFRESH_SECONDS)
+            try:
+                push = await client.wait_server_push()
+            except asyncio.TimeoutError:
+                push = []
+            client.idle_done()
+            await asyncio.wait_for(idle, timeout=COMMAND_TIMEOUT_SECONDS)
+
+            lines = push if isinstance(push, list) else []
+            if any(bytes(line).endswith(b"EXISTS") for line in lines if isinstance(line, (bytes, bytearray))):
+                logger.debug(f"IDLE push for {sync.account}: {lines}")
+                await self._fetch_new(client, sync, on_message)
+            else:
+                logger.debug(f"IDLE refresh for {sync.account}")
+
+    async def _fetch_new(self, client, sync: UIDSync, on_message: Callable[[EmailMessage], None]) -> None:
+        """Hand every message above the account's watermark to on_message."""
+        if sync.last_uid is None:
+            today = date.today().strftime("%d-%b-%Y")
+            response = _check(await client.uid_search(f"SINCE {today}"), "SEARCH")
+            uids = [int(uid) for line in response.lines[:1] for uid in bytes(line).split() if uid.isdigit()]
+            logger.info(f"No sync watermark for {sync.account} — found {len(uids)} message(s) since {today}")
+            fetch_set = ",".join(str(uid) for uid in uids)
+            floor = max(0, sync.uidnext - 1)
+        else:
+            fetch_set = f"{sync.last_uid + 1}:*"
+            floor = sync.last_uid
+
+        if fetch_set:
+            sizes = await self._fetch_sizes(client, fetch_set)
+            uids = [uid for uid in sorted(sizes) if sync.last_uid is None or uid > sync.last_uid]
+            if uids:
+                logger.info(f"Found {len(uids)} new message(s) for {sync.account}")
+            for action, chunk in plan_chunks(uids, sizes, sync.options):
+                if action == "skip":
+                    sync.advance(chunk[0])
+                elif not await self._fetch_chunk(client, sync, chunk, on_message):
+                    # Retry from the missing message on the next check
+                    return
+
+        if sync.last_uid is None or sync.last_uid < floor:
+            sync.advance(floor)
+
+    async def _fetch_sizes(self, client, fetch_set: str) -> dict[int, int]:
+        response = _check(await client.uid("fetch", fetch_set, "(RFC822.SIZE)"), "FETCH")
+        sizes = {}
+        for line in response.lines:
+            line = bytes(line)
+            uid, size = _UID.search(line), _SIZE.search(line)
+            if _FETCH_HEADER.match(line) and uid and size:
+                sizes[int(uid.group(1))] = int(size.group(1))
+        return sizes
+
+    async def _fetch_chunk(self, client, sync: UIDSync, uids: list[int], on_message) -> bool:
+        """Hand each message on, in UID order. Returns False, without advancing
+        past it, at the first message the server sent no body for."""
+        response = _check(await client.uid("fetch", ",".join(str(uid) for uid in uids), "(RFC822)"), "FETCH")
+        messages = _literals_by_uid(response.lines)
+        for uid in uids:
+            raw = messages.pop(uid, None)
+            if raw is None:
+                logger.warning(f"No body returned for UID {uid} of {sync.account} — will retry it")
+                return False
+            try:
+                message = parse_message(raw)
+                await asyncio.to_thread(on_message, message)
+            except Exception as e:
+                logger.error(f"Failed to parse message UID {uid}: {e}")
+            sync.advance(uid)
+        return True
+
+    async def _logout(self, client) -> None:
+        if client is None:
+            return
+        try:
+            await asyncio.wait_for(client.logout(), timeout=10)
+        except Exception:
+            pass
+
+
+def _check(response, command: str):
+    if response.result != "OK":
+        raise RuntimeError(f"{command} failed: {response.result} {response.lines}")
+    return response
+
+
+def _literals_by_uid(lines: list) -> dict[int, bytes]:
+    """Pair each FETCH response's literal with its UID.
+
+    The UID may come before the literal ("n FETCH (UID x RFC822 {size}")
+    or after it (a trailing " UID x)" line), so it is taken from any
+    non-literal line of the response.
+    """
+    messages = {}
+    uid = literal = None
+    for line in lines:
+        if isinstance(line, bytearray):
+            if literal is None:
+                literal = bytes(line)
+            continue
+        data = bytes(line)
+        if _FETCH_HEADER.match(data):
+            if uid is not None and literal is not None:
+                messages[uid] = literal
+            uid = literal = None
+        found = _UID.search(data)
+        if found and uid is None:
+            uid = int(found.group(1))
+    if uid is not None and literal is not None:
+        messages[uid] = literal
+    return messages
@@ -0,0 +1,135 @@
+import base64
+import binascii
+import quopri
+from dataclasses import dataclass
+from email.header import decode_header, make_header
+
+from capture.pdf_handler import PDF_MIME_TYPES
+from email_monitor.message_parser import MessagePart
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class PartRef:
+    """Where one MIME part lives in a message, read from its BODYSTRUCTURE."""
+    section: str          # IMAP section number, e.g. "1.2"
+    mime_type: str
+    encoding: str         # Content-Transfer-Encoding, lower-case
+    charset: str
+    filename: str
+    is_attachment: bool
+    size: int
+
+
+def list_parts(bodystructure) -> list[PartRef]:
+    """Flatten an imapclient BODYSTRUCTURE into its leaf parts, in order."""
+    refs: list[PartRef] = []
+    _walk(bodystructure, "", refs)
+    return refs
+
+
+def select_parts(refs: list[PartRef]) -> list[PartRef]:
+    """The parts the agent needs: first HTML body, first text body, every PDF."""
+    selected = []
+    have_html = have_text = False
+    for ref in refs:
+        if ref.mime_type in PDF_MIME_TYPES or ref.filename.lower().endswith(".pdf"):
+            selected.append(ref)
+        elif ref.is_attachment:
+            continue
+        elif ref.mime_type == "text/html" and not have_html:
+            selected.append(ref)
+            have_html = True
+        elif ref.mime_type == "text/plain" and not have_text:
+            selected.append(ref)
+            have_text = True
+    return selected
+
+
+def decode_part(ref: PartRef, data: bytes) -> MessagePart:
+    """Undo the part's Content-Transfer-Encoding."""
+    try:
+        if ref.encoding == "base64":
+            content = base64.b64decode(data)
+        elif ref.encoding == "quoted-printable":
+            content = quopri.decodestring(data)
+        else:
+            content = data
+    except (binascii.Error, ValueError) as e:
+        logger.warning(f"Could not decode part {ref.section} ({ref.encoding}): {e}")
+        content = data
+
+    return MessagePart(
+        mime_type=ref.mime_type,
+        content=content,
+        charset=ref.charset,
+        filename=ref.filename,
+        is_attachment=ref.is_attachment,
+    )
+
+
+def _walk(node, prefix: str, refs: list[PartRef]) -> None:
+    if isinstance(node[0], list):
+        # multipart: (children, subtype, ...) — children are numbered from 1
+        for index, child in enumerate(node[0], start=1):
+            _walk(child, f"{prefix}{index}" if not prefix else f"{prefix}.{index}", refs)
+        return
+
+    # A non-multipart message body is section 1
+    section = prefix or "1"
+    mime_type = f"{_text(node[0])}/{_text(node[1])}".lower()
+    if mime_type == "message/rfc822" and len(node) > 8 and isinstance(node[8], (tuple, list)):
+        # A forwarded message: (…, envelope, body, lines). Its parts are
+        # numbered under this section, and a single-part body is "N.1"
+        body = node[8]
+        _walk(body, section if isinstance(body[0], list) else f"{section}.1", refs)
+        return
+    params = _pairs(node[2])
+    disposition, disposition_params = _disposition(node)
+
+    filename = disposition_params.get("filename") or params.get("name") or ""
+    refs.append(PartRef(
+        section=section,
+        mime_type=mime_type,
+        encoding=_text(node[5]).lower() if len(node) > 5 else "7bit",
+        charset=params.get("charset", "utf-8"),
+        filename=_decode_filename(filename),
+        is_attachment=disposition == "attachment",
+        size=int(node[6]) if len(node) > 6 and node[6] else 0,
+    ))
+
+
+def _disposition(node) -> tuple[str, dict]:
+    """Find the (disposition, params) extension field; its position varies by part type."""
+    for item in node[7:]:
+        if (
+            isinstance(item, tuple)
+            and len(item) == 2
+            and isinstance(item[0], bytes)
+            and item[0].lower() in (b"attachment", b"inline")
+        ):
+            return item[0].decode("ascii").lower(), _pairs(item[1])
+    return "", {}
+
+
+def _pairs(values) -> dict:
+    """(b"CHARSET", b"utf-8", b"NAME", b"x.pdf") → {"charset": "utf-8", "name": "x.pdf"}."""
+    if not values or not isinstance(values, (tuple, list)):
+        return {}
+    return {_text(values[i]).lower(): _text(values[i + 1]) for i in range(0, len(values) - 1, 2)}
+
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value or "")
+
+
+def _decode_filename(filename: str) -> str:
+    """Decode RFC 2047 encoded-words, e.g. "=?utf-8?q?bill.pdf?="."""
+    try:
+        return str(make_header(decode_header(filename)))
+    except Exception:
+        return filename
@@ -7,13 +7,16 @@ from imapclient import IMAPClient
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from email_monitor.base_monitor import BaseMonitor
-from email_monitor.message_parser import parse_message
+from email_monitor.polling_monitor import PollingMonitor
+from email_monitor.uid_sync import FetchOptions, UIDSync
 from models.data_models import EmailMessage
 from utils.logger import get_logger
+from utils.sync_state import SyncStateStore
 
 logger = get_logger(__name__)
 
 IDLE_REFRESH_SECONDS = 20 * 60   # refresh IDLE every 20 min (server limit ~29 min)
+IDLE_RETRY_SECONDS = 60 * 60     # how long to poll before trying IDLE again
 
 
 class IMAPMonitor(BaseMonitor):
@@ -22,9 +25,28 @@ class IMAPMonitor(BaseMonitor):
     IMAP IDLE keeps a persistent connection open. The mail server sends
     a notification the moment a new message arrives — no polling needed.
     CPU usage between emails is effectively zero.
+
+    Only mail above the last-processed UID is fetched (see UIDSync), and an
+    IDLE EXISTS push triggers a direct fetch above it with no search.
+
+    Given a `fallback` PollingMonitor for the same mailbox, an account whose
+    IDLE sessions fail `max_idle_failures` times in a row (or whose server
+    doesn't offer IDLE) is polled instead for IDLE_RETRY_SECONDS, then
+    IDLE is tried again.
     """
 
-    def __init__(self, host: str, port: int, username: str, password: str, mailbox: str = "INBOX"):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        mailbox: str = "INBOX",
+        sync_store: SyncStateStore | None = None,
+        fetch_options: FetchOptions | None = None,
+        fallback: PollingMonitor | None = None,
+        max_idle_failures: int = 3,
+    ):
         self.host = host
         self.port = port
         self.username = username
@@ -32,40 +54,66 @@ class IMAPMonitor(BaseMonitor):
         self.mailbox = mailbox
         self._client: IMAPClient | None = None
         self._stop_event = threading.Event()
+        self._sync = UIDSync(f"{username}@{host}", mailbox, store=sync_store, options=fetch_options)
+        self.fallback = fallback
+        self.max_idle_failures = max_idle_failures
 
     def start(self, on_message: Callable[[EmailMessage], None]) -> None:
         """Connect and begin IDLE loop. Blocks until stop() is called."""
         logger.info(f"Starting IMAP IDLE monitor for {self.username} on {self.host}")
+        failures = 0
         while not self._stop_event.is_set():
+            if self.fallback and failures >= self.max_idle_failures:
+                logger.warning(
+                    f"IDLE failed {failures} times in a row for {self.username} — "
+                    f"polling for the next {IDLE_RETRY_SECONDS // 60} minutes"
+                )
+                self.fallback.poll_until(on_message, deadline=time.monotonic() + IDLE_RETRY_SECONDS)
+                failures = 0
+                continue
+
+            started = time.monotonic()
             try:
                 self._run_idle_loop(on_message)
             except Exception as e:
+                # A session that lasted a full IDLE cycle before dropping is
+                # an ordinary disconnect, not a sign IDLE doesn't work here
+                failures = 1 if time.monotonic() - started > IDLE_REFRESH_SECONDS else failures + 1
                 logger.error(f"IMAP connection error: {e}. Reconnecting in 30s...")
-                time.sleep(30)
+                self._logout()
+                self._stop_event.wait(30)
 
     def stop(self) -> None:
         self._stop_event.set()
-        if self._client:
+        if self.fallback:
+            self.fallback.stop()
+        self._logout()
+        logger.info(f"IMAP monitor stopped for {self.username}")
+
+    def _logout(self) -> None:
+        client, self._client = self._client, None
+        if client:
             try:
-                self._client.logout()
+                client.logout()
             except Exception:
                 pass
-        logger.info(f"IMAP monitor stopped for {self.username}")
 
     @retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=2, min=4, max=60))
     def _connect(self) -> IMAPClient:
         context = ssl.create_default_context()
         client = IMAPClient(self.host, port=self.port, ssl=True, ssl_context=context)
         client.login(self.username, self.password)
-        client.select_folder(self.mailbox)
+        self._sync.on_select(client.select_folder(self.mailbox))
         logger.info(f"Connected to {self.host} as {self.username}")
         return client
 
     def _run_idle_loop(self, on_message: Callable[[EmailMessage], None]) -> None:
         self._client = self._connect()
+        if b"IDLE" not in self._client.capabilities():
+            raise RuntimeError(f"{self.host} does not support IDLE")
 
-        # Process any unread messages that arrived while we were offline
-        self._fetch_unseen(on_message)
+        # Process anything that arrived while we were offline
+        self._sync.fetch_new(self._client, on_message)
 
         while not self._stop_event.is_set():
             self._client.idle()
@@ -77,25 +125,8 @@ class IMAPMonitor(BaseMonitor):
 
             if responses:
                 logger.debug(f"IDLE response received: {responses}")
-                self._fetch_unseen(on_message)
+                if any(len(r) > 1 and r[1] == b"EXISTS" for r in responses):
+                    self._sync.fetch_new(self._client, on_message, known_new=True)
             else:
                 # Timeout — send IDLE refresh so server doesn't drop connection
                 logger.debug("IDLE timeout — refreshing connection")
-
-    def _fetch_unseen(self, on_message: Callable[[EmailMessage], None]) -> None:
-        """Fetch UNSEEN messages received today or later only."""
-        from datetime import date
-        today = date.today().strftime("%d-%b-%Y")   # e.g. "20-Feb-2026"
-        uids = self._client.search(["UNSEEN", "SINCE", today])
-        if not uids:
-            return
-        logger.info(f"Found {len(uids)} unseen message(s) since {today}")
-        for uid, data in self._client.fetch(uids, ["RFC822"]).items():
-            raw = data.get(b"RFC822")
-            if not raw:
-                continue
-            try:
-                message = parse_message(raw)
-                on_message(message)
-            except Exception as e:
-                logger.error(f"Failed to parse message UID {uid}: {e}")
@@ -1,7 +1,9 @@
 import email
 import email.policy
+from dataclasses import dataclass
 from datetime import date, datetime
 from email.message import EmailMessage as StdEmailMessage
+from typing import Optional
 
 from models.data_models import Attachment, EmailMessage
 from utils.logger import get_logger
@@ -9,13 +11,26 @@ from utils.logger import get_logger
 logger = get_logger(__name__)
 
 
-def parse_message(raw_bytes: bytes) -> EmailMessage:
+@dataclass
+class MessagePart:
+    """One MIME part fetched on its own (BODY.PEEK[section]), already decoded."""
+    mime_type: str
+    content: bytes
+    charset: str = "utf-8"
+    filename: str = ""
+    is_attachment: bool = False
+
+
+def parse_message(raw_bytes: bytes, parts: Optional[list[MessagePart]] = None) -> EmailMessage:
     """Parse raw IMAP message bytes into a clean EmailMessage dataclass.
 
     Extracts:
     - message_id, from address, subject, date
     - HTML body (preferred) and plain-text body
     - Any PDF or image attachments
+
+    If `parts` is given, raw_bytes holds only the message headers and the
+    bodies and attachments come from those selectively fetched parts.
     """
     msg: StdEmailMessage = email.message_from_bytes(
         raw_bytes, policy=email.policy.default
@@ -26,6 +41,9 @@ def parse_message(raw_bytes: bytes) -> EmailMessage:
     subject = msg.get("Subject", "(no subject)").strip()
     received_date = _parse_date(msg.get("Date", ""))
 
+    if parts is not None:
+        return _from_parts(message_id, from_address, subject, received_date, parts)
+
     body_html = ""
     body_text = ""
     attachments: list[Attachment] = []
@@ -68,6 +86,53 @@ def parse_message(raw_bytes: bytes) -> EmailMessage:
     )
 
 
+def _from_parts(
+    message_id: str,
+    from_address: str,
+    subject: str,
+    received_date: date,
+    parts: list[MessagePart],
+) -> EmailMessage:
+    """Build an EmailMessage from selectively fetched parts."""
+    body_html = ""
+    body_text = ""
+    attachments: list[Attachment] = []
+
+    for part in parts:
+        if part.is_attachment or part.mime_type not in ("text/html", "text/plain"):
+            attachments.append(Attachment(
+                filename=part.filename or "attachment",
+                mime_type=part.mime_type,
+                content=part.content,
+            ))
+        elif part.mime_type == "text/html" and not body_html:
+            body_html = _decode_text(part.content, part.charset)
+        elif part.mime_type == "text/plain" and not body_text:
+            body_text = _decode_text(part.content, part.charset)
+
+    logger.debug(
+        f"Parsed email from {len(parts)} part(s): subject='{subject}' "
+        f"from='{from_address}' attachments={len(attachments)}"
+    )
+
+    return EmailMessage(
+        message_id=message_id,
+        from_address=from_address,
+        subject=subject,
+        date=received_date,
+        body_html=body_html,
+        body_text=body_text,
+        attachments=attachments,
+    )
+
+
+def _decode_text(content: bytes, charset: str) -> str:
+    try:
+        return content.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return content.decode("utf-8", errors="replace")
+
+
 def _parse_date(date_str: str) -> date:
     """Parse the email Date header into a Python date.
     Falls back to today if unparseable."""
@@ -1,13 +1,16 @@
 import ssl
+import threading
 import time
 from typing import Callable
 
 from imapclient import IMAPClient
 
+from email_monitor.adaptive_scheduler import AdaptiveScheduler
 from email_monitor.base_monitor import BaseMonitor
-from email_monitor.message_parser import parse_message
+from email_monitor.uid_sync import FetchOptions, UIDSync
 from models.data_models import EmailMessage
 from utils.logger import get_logger
+from utils.sync_state import SyncStateStore
 
 logger = get_logger(__name__)
 
@@ -17,6 +20,17 @@ class PollingMonitor(BaseMonitor):
 
     Use this when IMAP IDLE is not available or when running in an
     environment where persistent connections are unreliable.
+
+    Only mail above the last-processed UID is fetched (see UIDSync).
+
+    One logged-in session is kept across ticks: each tick sends a NOOP
+    (which also keeps the session alive) and checks STATUS UIDNEXT, and
+    only fetches when either shows new mail. The connection is rebuilt
+    only after a failure, so a quiet tick costs two round trips instead
+    of a TLS handshake, LOGIN and SELECT.
+
+    With an AdaptiveScheduler the wait between checks follows the
+    mailbox's activity instead of the fixed interval.
     """
 
     def __init__(
@@ -27,6 +41,9 @@ class PollingMonitor(BaseMonitor):
         password: str,
         mailbox: str = "INBOX",
         interval_minutes: int = 15,
+        sync_store: SyncStateStore | None = None,
+        fetch_options: FetchOptions | None = None,
+        scheduler: AdaptiveScheduler | None = None,
     ):
         self.host = host
         self.port = port
@@ -34,43 +51,123 @@ class PollingMonitor(BaseMonitor):
         self.password = password
         self.mailbox = mailbox
         self.interval_seconds = interval_minutes * 60
-        self._running = False
+        self.scheduler = scheduler
+        self._client: IMAPClient | None = None
+        self._stop_event = threading.Event()
+        self._sync = UIDSync(f"{username}@{host}", mailbox, store=sync_store, options=fetch_options)
+        self._connects = 0
+        self._reused = 0
+        self._handshake_seconds = 0.0
 
     def start(self, on_message: Callable[[EmailMessage], None]) -> None:
-        logger.info(
-            f"Starting polling monitor for {self.username} — "
-            f"checking every {self.interval_seconds // 60} minutes"
-        )
-        self._running = True
-        while self._running:
+        if self.scheduler:
+            logger.info(
+                f"Starting adaptive polling monitor for {self.username} — checking every "
+                f"{self.scheduler.min_seconds:.0f}s to {self.scheduler.max_seconds:.0f}s"
+            )
+        else:
+            logger.info(
+                f"Starting polling monitor for {self.username} — "
+                f"checking every {self.interval_seconds // 60} minutes"
+            )
+        self.poll_until(on_message)
+
+    def poll_until(self, on_message: Callable[[EmailMessage], None], deadline: float | None = None) -> None:
+        """Poll until stop() is called or time.monotonic() passes `deadline`.
+
+        IMAPMonitor uses this with a deadline to fall back to polling for a
+        while when IDLE keeps failing; the session is closed on return.
+        """
+        while not self._stop_event.is_set():
             try:
-                self._check_inbox(on_message)
+                found = self._check_inbox(on_message)
             except Exception as e:
                 logger.error(f"Polling error: {e}")
-            time.sleep(self.interval_seconds)
+                self._disconnect()
+                found = 0
+
+            if self.scheduler:
+                self.scheduler.record(found)
+                wait = self.scheduler.next_interval()
+            else:
+                wait = self.interval_seconds
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    break
+            self._stop_event.wait(wait)
+
+        if deadline is not None:
+            self._disconnect()
 
     def stop(self) -> None:
-        self._running = False
-        logger.info(f"Polling monitor stopped for {self.username}")
+        self._stop_event.set()
+        self._disconnect()
+        logger.info(f"Polling monitor stopped for {self.username} — connections: {self.stats()}")
+
+    def stats(self) -> dict:
+        """Connections opened vs ticks served by an existing session."""
+        return {
+            "connects": self._connects,
+            "reused": self._reused,
+            "avg_handshake_ms": round(1000 * self._handshake_seconds / self._connects) if self._connects else 0,
+        }
 
-    def _check_inbox(self, on_message: Callable[[EmailMessage], None]) -> None:
+    def _check_inbox(self, on_message: Callable[[EmailMessage], None]) -> int:
+        """Fetch any new mail; returns how many messages were handed on."""
+        if self._client is not None:
+            try:
+                has_new = self._poll()
+                self._reused += 1
+            except Exception as e:
+                logger.warning(f"Session for {self.username} lost ({e}) — reconnecting")
+                self._disconnect()
+            else:
+                if not has_new:
+                    logger.debug("No new messages")
+                    return 0
+                return self._sync.fetch_new(self._client, on_message, known_new=True)
+
+        self._client = self._connect()
+        count = self._sync.fetch_new(self._client, on_message)
+        if not count:
+            logger.debug("No new messages")
+        return count
+
+    def _poll(self) -> bool:
+        """Ask the open session whether anything arrived above the watermark."""
+        responses = self._client.noop()[1]
+        if any(len(r) > 1 and r[1] == b"EXISTS" for r in responses):
+            return True
+        if self._sync.last_uid is None:
+            return True
+        status = self._client.folder_status(self.mailbox, [b"UIDNEXT"])
+        return int(status.get(b"UIDNEXT", 0)) - 1 > self._sync.last_uid
+
+    def _connect(self) -> IMAPClient:
+        started = time.monotonic()
         context = ssl.create_default_context()
-        with IMAPClient(self.host, port=self.port, ssl=True, ssl_context=context) as client:
+        client = IMAPClient(self.host, port=self.port, ssl=True, ssl_context=context)
+        try:
             client.login(self.username, self.password)
-            client.select_folder(self.mailbox)
-            from datetime import date
-            today = date.today().strftime("%d-%b-%Y")
-            uids = client.search(["UNSEEN", "SINCE", today])
-            if not uids:
-                logger.debug("No new messages")
-                return
-            logger.info(f"Found {len(uids)} new message(s) since {today}")
-            for uid, data in client.fetch(uids, ["RFC822"]).items():
-                raw = data.get(b"RFC822")
-                if not raw:
-                    continue
-                try:
-                    message = parse_message(raw)
-                    on_message(message)
-                except Exception as e:
-                    logger.error(f"Failed to parse message UID {uid}: {e}")
+            self._sync.on_select(client.select_folder(self.mailbox))
+        except Exception:
+            try:
+                client.shutdown()
+            except Exception:
+                pass
+            raise
+        elapsed = time.monotonic() - started
+        self._connects += 1
+        self._handshake_seconds += elapsed
+        logger.info(f"Connected to {self.host} as {self.username} in {elapsed * 1000:.0f} ms (connection #{self._connects})")
+        return client
+
+    def _disconnect(self) -> None:
+        client, self._client = self._client, None
+        if client is None:
+            return
+        try:
+            client.logout()
+        except Exception:
+            pass
@@ -0,0 +1,266 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Optional
+
+from imapclient import IMAPClient
+
+from email_monitor.body_structure import decode_part, list_parts, select_parts
+from email_monitor.message_parser import parse_message
+from models.data_models import EmailMessage
+from utils.dedup_store import DedupStore
+from utils.logger import get_logger
+from utils.sync_state import SyncStateStore
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class FetchOptions:
+    """How monitors download new messages."""
+    # Fetch ENVELOPE + BODYSTRUCTURE first, skip already-processed Message-IDs,
+    # then download only the HTML/text bodies and PDF parts
+    two_phase: bool = False
+    dedup_store: Optional[DedupStore] = None
+    # Most message bytes held in memory by one FETCH; messages above
+    # max_message_bytes are skipped (checked against RFC822.SIZE up front)
+    chunk_bytes: int = 20 * 1024 * 1024
+    max_message_bytes: int = 40 * 1024 * 1024
+
+
+class UIDSync:
+    """Incremental sync of one mailbox using a UID watermark.
+
+    Remembers the mailbox's UIDVALIDITY and the highest UID already handed
+    to on_message, so each check fetches only newer mail, whether or not it
+    has been read elsewhere and however long we were offline.
+
+    With no watermark yet (first run, or the server reset UIDVALIDITY) it
+    falls back to everything received since today, then starts tracking.
+    Without a SyncStateStore the watermark lives only in memory.
+    """
+
+    def __init__(
+        self,
+        account: str,
+        mailbox: str,
+        store: Optional[SyncStateStore] = None,
+        options: Optional[FetchOptions] = None,
+    ):
+        self.account = account
+        self.mailbox = mailbox
+        self.store = store
+        self.options = options or FetchOptions()
+        self.uidvalidity: Optional[int] = None
+        self.last_uid: Optional[int] = None
+        self.uidnext = 0
+
+    def on_select(self, select_info: dict) -> None:
+        """Load the watermark after SELECT, discarding it if UIDVALIDITY changed."""
+        uidvalidity = int(select_info.get(b"UIDVALIDITY", 0))
+        self.uidnext = int(select_info.get(b"UIDNEXT", 0))
+
+        if self.store:
+            state = self.store.get(self.account, self.mailbox)
+        else:
+            state = (self.uidvalidity, self.last_uid) if self.last_uid is not None else None
+
+        if state and state[0] == uidvalidity:
+            self.last_uid = state[1]
+        else:
+            if state:
+                logger.warning(
+                    f"UIDVALIDITY of {self.account}/{self.mailbox} changed "
+                    f"({state[0]} → {uidvalidity}) — resyncing from today"
+                )
+            self.last_uid = None
+        self.uidvalidity = uidvalidity
+
+    def fetch_new(
+        self,
+        client: IMAPClient,
+        on_message: Callable[[EmailMessage], None],
+        known_new: bool = False,
+    ) -> int:
+        """Hand every message above the watermark to on_message. Returns how many.
+
+        Args:
+            known_new: The server just announced new mail (IDLE EXISTS), so
+                       skip the UID SEARCH and fetch above the watermark directly.
+        """
+        if self.last_uid is None:
+            today = date.today().strftime("%d-%b-%Y")   # e.g. "20-Feb-2026"
+            uids = client.search(["SINCE", today])
+            logger.info(f"No sync watermark for {self.account} — found {len(uids)} message(s) since {today}")
+            floor = max(0, self.uidnext - 1)
+        elif known_new:
+            uids = None
+            floor = self.last_uid
+        else:
+            uids = [uid for uid in client.search(["UID", f"{self.last_uid + 1}:*"]) if uid > self.last_uid]
+            floor = self.last_uid
+            if not uids:
+                return 0
+            logger.info(f"Found {len(uids)} new message(s) above UID {self.last_uid}")
+
+        count, complete = 0, True
+        if uids is None or uids:
+            fetch_set = uids if uids is not None else f"{self.last_uid + 1}:*"
+            count, complete = self._fetch(client, fetch_set, on_message)
+
+        # Nothing at all above the floor (or a first run with no mail today):
+        # still start tracking from the current end of the mailbox. Not when
+        # a message went undelivered, or the floor would jump past it
+        if complete and (self.last_uid is None or self.last_uid < floor):
+            self.advance(floor)
+        return count
+
+    def _fetch(self, client: IMAPClient, fetch_set, on_message: Callable[[EmailMessage], None]) -> tuple[int, bool]:
+        """(messages handed on, False if it stopped at an undelivered message)."""
+        if self.options.two_phase:
+            return self._fetch_two_phase(client, fetch_set, on_message)
+
+        # Sizes first, so one FETCH never holds more than chunk_bytes of mail
+        response = client.fetch(fetch_set, ["RFC822.SIZE"])
+        sizes = {uid: int(data.get(b"RFC822.SIZE", 0)) for uid, data in response.items()}
+        uids = [uid for uid in sorted(sizes) if self.last_uid is None or uid > self.last_uid]
+
+        count = 0
+        for action, chunk in plan_chunks(uids, sizes, self.options):
+            if action == "skip":
+                self.advance(chunk[0])
+                continue
+            fetched, complete = self._fetch_chunk(client, chunk, on_message)
+            count += fetched
+            if not complete:
+                return count, False
+        return count, True
+
+    def _fetch_chunk(
+        self, client: IMAPClient, uids: list[int], on_message: Callable[[EmailMessage], None]
+    ) -> tuple[int, bool]:
+        """Download one bounded batch of full messages and hand each one on.
+
+        Stops, without advancing past it, at the first message the server sent
+        no body for; it is retried on the next check. Returns (count, complete).
+        """
+        if not uids:
+            return 0, True
+        count = 0
+        response = client.fetch(uids, ["RFC822"])
+        for uid in uids:
+            raw = response.pop(uid, {}).get(b"RFC822")
+            if not raw:
+                logger.warning(f"No body returned for UID {uid} of {self.account} — will retry it")
+                return count, False
+            try:
+                message = parse_message(raw)
+            except Exception as e:
+                logger.error(f"Failed to parse message UID {uid}: {e}")
+                self.advance(uid)
+                continue
+            on_message(message)
+            count += 1
+            self.advance(uid)
+        return count, True
+
+    def _fetch_two_phase(
+        self, client: IMAPClient, fetch_set, on_message: Callable[[EmailMessage], None]
+    ) -> tuple[int, bool]:
+        """Fetch structure first, then only the parts the agent uses.
+
+        Already-processed Message-IDs are skipped before any body is
+        downloaded, and photo dumps or calendar invites never leave the
+        server. BODY.PEEK leaves the \\Seen flag alone. Bodies are fetched
+        one message at a time, so memory is bounded by the largest message.
+        """
+        count = 0
+        summary = client.fetch(fetch_set, ["ENVELOPE", "BODYSTRUCTURE", "RFC822.SIZE"])
+        for uid in sorted(summary):
+            if self.last_uid is not None and uid <= self.last_uid:
+                continue
+            data = summary[uid]
+            envelope = data.get(b"ENVELOPE")
+            message_id = (envelope.message_id or b"").decode("utf-8", errors="replace") if envelope else ""
+
+            dedup = self.options.dedup_store
+            if message_id and dedup and dedup.already_processed(message_id):
+                logger.info(f"UID {uid} already processed — not downloading: {message_id}")
+                self.advance(uid)
+                continue
+
+            try:
+                refs = select_parts(list_parts(data[b"BODYSTRUCTURE"]))
+            except Exception as e:
+                logger.error(f"Could not read the structure of UID {uid}: {e} — skipping it")
+                self.advance(uid)
+                continue
+            wanted_bytes = sum(ref.size for ref in refs)
+            if wanted_bytes > self.options.max_message_bytes:
+                logger.warning(
+                    f"Skipping UID {uid}: its bodies and PDFs total {wanted_bytes} bytes, over the "
+                    f"{self.options.max_message_bytes}-byte message limit"
+                )
+                self.advance(uid)
+                continue
+
+            # IMAP and socket errors propagate to the monitor's reconnect
+            # logic, leaving the watermark before this message
+            items = ["BODY.PEEK[HEADER]"] + [f"BODY.PEEK[{ref.section}]" for ref in refs]
+            body = client.fetch([uid], items).get(uid)
+            if not body or not body.get(b"BODY[HEADER]"):
+                logger.warning(f"No body returned for UID {uid} of {self.account} — will retry it")
+                return count, False
+            try:
+                parts = [decode_part(ref, body.get(f"BODY[{ref.section}]".encode(), b"") or b"") for ref in refs]
+                message = parse_message(body[b"BODY[HEADER]"], parts=parts)
+            except Exception as e:
+                logger.error(f"Failed to parse message UID {uid}: {e} — skipping it")
+                self.advance(uid)
+                continue
+            logger.debug(
+                f"UID {uid}: downloaded {sum(len(p.content) for p in parts)} of "
+                f"{data.get(b'RFC822.SIZE', 0)} bytes in {len(parts)} part(s)"
+            )
+            on_message(message)
+            count += 1
+            self.advance(uid)
+        return count, True
+
+    def advance(self, uid: int) -> None:
+        """Move the watermark past a UID that has been handled (or skipped)."""
+        if self.last_uid is not None and uid <= self.last_uid:
+            return
+        self.last_uid = uid
+        if self.store and self.uidvalidity is not None:
+            self.store.set(self.account, self.mailbox, self.uidvalidity, uid)
+
+
+def plan_chunks(uids: list[int], sizes: dict[int, int], options: FetchOptions) -> list[tuple[str, list[int]]]:
+    """Group UIDs, in order, into FETCH batches of at most options.chunk_bytes.
+
+    Returns ("fetch", [uids]) batches interleaved with ("skip", [uid]) for
+    messages over options.max_message_bytes, which are logged here.
+    """
+    plan: list[tuple[str, list[int]]] = []
+    chunk: list[int] = []
+    chunk_size = 0
+    for uid in uids:
+        size = sizes.get(uid, 0)
+        if size > options.max_message_bytes:
+            if chunk:
+                plan.append(("fetch", chunk))
+                chunk, chunk_size = [], 0
+            logger.warning(
+                f"Skipping UID {uid}: {size} bytes exceeds the "
+                f"{options.max_message_bytes}-byte message limit"
+            )
+            plan.append(("skip", [uid]))
+            continue
+        if chunk and chunk_size + size > options.chunk_bytes:
+            plan.append(("fetch", chunk))
+            chunk, chunk_size = [], 0
+        chunk.append(uid)
+        chunk_size += size
+    if chunk:
+        plan.append(("fetch", chunk))
+    return plan
@@ -1,5 +1,8 @@
 import io
+import threading
 
+import google_auth_httplib2
+import httplib2
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
@@ -10,11 +13,17 @@ logger = get_logger(__name__)
 
 
 class DriveClient:
-    """Uploads files to a specific Google Drive folder."""
+    """Uploads files to a specific Google Drive folder.
+
+    httplib2 connections are not thread-safe, so each thread that uploads
+    gets its own authorised connection.
+    """
 
     def __init__(self, credentials: Credentials, folder_id: str):
+        self.credentials = credentials
         self.service = build("drive", "v3", credentials=credentials)
         self.folder_id = folder_id
+        self._local = threading.local()
 
     def upload_file(self, filename: str, content: bytes, mime_type: str) -> str:
         """Upload a file to the configured Drive folder.
@@ -39,8 +48,14 @@ class DriveClient:
             body=file_metadata,
             media_body=media,
             fields="id, webViewLink",
-        ).execute()
+        ).execute(http=self._http())
 
         link = file.get("webViewLink", "")
         logger.info(f"Uploaded '{filename}' → {link}")
         return link
+
+    def _http(self) -> google_auth_httplib2.AuthorizedHttp:
+        """Return this thread's authorised HTTP connection."""
+        if not hasattr(self._local, "http"):
+            self._local.http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return self._local.http
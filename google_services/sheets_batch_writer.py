@@ -0,0 +1,124 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from google_services.sheets_client import SheetsClient
+from models.data_models import SheetRow
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SheetsBatchWriter:
+    """Buffers SheetRows and appends them to the sheet in batches.
+
+    A drop-in replacement for SheetsClient.append_row: rows are collected
+    and written with a single append request once `max_rows` are waiting or
+    the oldest has waited `max_delay_seconds`, and once more on close().
+    This keeps a backfill well inside the Sheets per-minute quota.
+
+    Rows are written in the order they were added. append_row returns a
+    Future that resolves once the row is in the sheet, so callers can hold
+    off marking an email processed until then. A flush that still fails
+    after SheetsClient's retries leaves its rows at the front of the buffer,
+    to be retried on the next flush; rows still unwritten at close() fail
+    their Futures. A retried batch first drops rows whose Drive link is
+    already in the sheet, in case the failed request was in fact applied.
+    """
+
+    def __init__(self, sheets_client: SheetsClient, max_rows: int = 50, max_delay_seconds: float = 30):
+        self.sheets_client = sheets_client
+        self.max_rows = max_rows
+        self.max_delay_seconds = max_delay_seconds
+        self._buffer: list[tuple[SheetRow, Future]] = []
+        self._oldest_at = 0.0
+        self._failed = False     # the last flush failed, so its batch may be partly written
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True, name="sheets-batch-writer")
+        self._thread.start()
+
+    def append_row(self, row: SheetRow) -> Future:
+        """Queue a row to be written with the next batch.
+
+        Returns a Future that resolves when the row has been appended, or
+        fails if it is still unwritten at close().
+        """
+        written = Future()
+        with self._condition:
+            if not self._buffer:
+                self._oldest_at = time.monotonic()
+            self._buffer.append((row, written))
+            if len(self._buffer) >= self.max_rows:
+                self._condition.notify()
+        logger.debug(f"Buffered row → {row.purchase_date} | {row.item_name} | {row.amount}")
+        return written
+
+    def flush(self) -> bool:
+        """Write every buffered row now. Returns False if the append failed."""
+        with self._flush_lock:
+            with self._condition:
+                batch = list(self._buffer)
+            if not batch:
+                return True
+
+            rows = [row for row, _ in batch]
+            try:
+                if self._failed:
+                    logged = self.sheets_client.logged_links()
+                    rows = [row for row in rows if not row.drive_link or row.drive_link not in logged]
+                if rows:
+                    self.sheets_client.append_rows(rows)
+            except Exception as e:
+                self._failed = True
+                logger.error(f"Failed to append {len(batch)} row(s) to Sheet — will retry: {e}")
+                return False
+            self._failed = False
+
+            with self._condition:
+                # Rows added during the append stay queued behind this batch
+                del self._buffer[:len(batch)]
+                if self._buffer:
+                    self._oldest_at = time.monotonic()
+            logger.info(f"Flushed {len(rows)} row(s) to Sheet")
+            # Still under the flush lock, so once flush() returns every
+            # callback for this batch has run
+            for _, written in batch:
+                written.set_result(None)
+            return True
+
+    def close(self) -> None:
+        """Stop the background flusher and write any remaining rows."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        if not self.flush():
+            with self._condition:
+                remaining = list(self._buffer)
+                self._buffer.clear()
+            for row, written in remaining:
+                logger.error(f"Unwritten Sheet row: {row.purchase_date} | {row.item_name} | {row.amount} | {row.drive_link}")
+                written.set_exception(RuntimeError("Sheet row was not written before shutdown"))
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if len(self._buffer) >= self.max_rows:
+                        break
+                    if self._buffer:
+                        remaining = self._oldest_at + self.max_delay_seconds - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(timeout=remaining)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+
+            if not self.flush():
+                # Back off before retrying a batch the API just rejected
+                with self._condition:
+                    self._condition.wait(timeout=self.max_delay_seconds)
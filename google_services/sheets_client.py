@@ -1,14 +1,31 @@
+import threading
+
+import google_auth_httplib2
+import httplib2
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_exponential
 
 from models.data_models import SheetRow
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+RETRYABLE_STATUSES = {429, 500, 502, 503}
+
+
+def _is_retryable(error: BaseException) -> bool:
+    """Quota (429) and transient server errors are worth retrying."""
+    return isinstance(error, HttpError) and error.resp.status in RETRYABLE_STATUSES
+
 
 class SheetsClient:
-    """Appends rows to a Google Sheet."""
+    """Appends rows to a Google Sheet.
+
+    httplib2 connections are not thread-safe, so each thread that appends
+    gets its own authorised connection.
+    """
 
     def __init__(
         self,
@@ -16,21 +33,50 @@ class SheetsClient:
         spreadsheet_id: str,
         sheet_name: str = "Sheet1",
     ):
+        self.credentials = credentials
         self.service = build("sheets", "v4", credentials=credentials)
         self.spreadsheet_id = spreadsheet_id
         self.sheet_name = sheet_name
+        self._local = threading.local()
 
     def append_row(self, row: SheetRow) -> None:
         """Add one row to the bottom of the sheet.
 
         Columns (in order): Date | Item | Amount | Drive Link
         """
-        values = [[
-            row.purchase_date,   # e.g. "2026-02-20"
-            row.item_name,       # e.g. "Pharmacy copay"
-            row.amount,          # e.g. "$45.60"
-            row.drive_link,      # clickable Drive URL
-        ]]
+        self.append_rows([row])
+
+    def append_rows(self, rows: list[SheetRow]) -> None:
+        """Add several rows, in order, with a single append request.
+
+        Retries with exponential backoff on 429 (quota) and 5xx responses.
+        A 5xx can arrive after the rows were written, so each retry first
+        drops rows whose Drive link is already in the sheet.
+        """
+        pending = list(rows)
+        for attempt in Retrying(
+            retry=retry_if_exception(_is_retryable),
+            stop=stop_after_attempt(5),
+            wait=wait_exponential(multiplier=2, min=2, max=60),
+            reraise=True,
+        ):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    logged = self.logged_links()
+                    pending = [row for row in pending if not row.drive_link or row.drive_link not in logged]
+                if pending:
+                    self._append(pending)
+
+    def _append(self, rows: list[SheetRow]) -> None:
+        values = [
+            [
+                row.purchase_date,   # e.g. "2026-02-20"
+                row.item_name,       # e.g. "Pharmacy copay"
+                row.amount,          # e.g. "$45.60"
+                row.drive_link,      # clickable Drive URL
+            ]
+            for row in rows
+        ]
 
         self.service.spreadsheets().values().append(
             spreadsheetId=self.spreadsheet_id,
@@ -38,8 +84,23 @@ class SheetsClient:
             valueInputOption="USER_ENTERED",
             insertDataOption="INSERT_ROWS",
             body={"values": values},
-        ).execute()
+        ).execute(http=self._http())
+
+        for row in rows:
+            logger.info(
+                f"Logged → {row.purchase_date} | {row.item_name} | {row.amount}"
+            )
+
+    def logged_links(self) -> set[str]:
+        """Every Drive link already in the sheet's Drive Link column."""
+        response = self.service.spreadsheets().values().get(
+            spreadsheetId=self.spreadsheet_id,
+            range=f"'{self.sheet_name}'!D:D",
+        ).execute(http=self._http())
+        return {row[0] for row in response.get("values", []) if row}
 
-        logger.info(
-            f"Logged → {row.purchase_date} | {row.item_name} | {row.amount}"
-        )
+    def _http(self) -> google_auth_httplib2.AuthorizedHttp:
+        """Return this thread's authorised HTTP connection."""
+        if not hasattr(self._local, "http"):
+            self._local.http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return self._local.http
@@ -2,8 +2,10 @@
 HSA Tracker — entry point.
 
 Starts one email monitor per configured IMAP account, each running in its
-own background thread. When an email arrives, the HSAAgent processes it:
-classify → extract → upload to Drive → log to Sheets.
+own background thread (or, with MONITOR_MODE=async, every account on one
+asyncio event loop). When an email arrives it is handed to the processing
+pipeline, which runs HSAAgent's steps on separate worker pools:
+capture → classify → extract → upload to Drive → log to Sheets.
 
 Stop the agent at any time with Ctrl+C.
 """
@@ -12,23 +14,32 @@ import signal
 import sys
 import threading
 
-from config import load_settings
+from config import Settings, load_settings
 from agent.hsa_agent import HSAAgent
+from agent.pipeline import Pipeline
+from agent.prefilter import PreFilter
+from email_monitor.adaptive_scheduler import AdaptiveScheduler
+from email_monitor.async_imap_monitor import AsyncIMAPMonitor
 from email_monitor.imap_monitor import IMAPMonitor
 from email_monitor.polling_monitor import PollingMonitor
+from email_monitor.uid_sync import FetchOptions
 from google_services.auth import get_credentials
 from google_services.drive_client import DriveClient
+from google_services.sheets_batch_writer import SheetsBatchWriter
 from google_services.sheets_client import SheetsClient
 from utils.dedup_store import DedupStore
 from utils.logger import get_logger, setup_logging
+from utils.result_cache import ResultCache
+from utils.sync_state import SyncStateStore
+from utils.work_queue import WorkQueue
 
 
-def main() -> None:
-    # ── 1. Load config from .env ─────────────────────────────────────────────
-    settings = load_settings()
-    setup_logging(log_level=settings.log_level, log_file=settings.log_file or "")
+def build_agent(settings: Settings) -> HSAAgent:
+    """Authenticate with Google and build the agent with all its services.
+
+    Shared by main() and backfill.py; release it with close_agent().
+    """
     logger = get_logger(__name__)
-    logger.info("HSA Tracker starting…")
 
     # ── 2. Authenticate with Google (opens browser on first run) ─────────────
     logger.info("Loading Google credentials…")
@@ -47,56 +58,165 @@ def main() -> None:
         spreadsheet_id=settings.google_sheets_spreadsheet_id,
         sheet_name=settings.google_sheets_sheet_name,
     )
+    sheets_writer = None
+    if settings.sheets_batch_size > 1:
+        sheets_writer = SheetsBatchWriter(
+            sheets_client,
+            max_rows=settings.sheets_batch_size,
+            max_delay_seconds=settings.sheets_batch_max_delay_seconds,
+        )
 
     # ── 4. Build the agent ───────────────────────────────────────────────────
     dedup_store = DedupStore(db_path=settings.dedup_db_path)
-    agent = HSAAgent(
+    result_cache = None
+    if settings.result_cache_enabled:
+        result_cache = ResultCache(
+            db_path=settings.dedup_db_path,
+            max_entries=settings.result_cache_max_entries,
+            max_age_days=settings.result_cache_max_age_days,
+        )
+    prefilter = None
+    if settings.prefilter_enabled:
+        prefilter = PreFilter(
+            db_path=settings.dedup_db_path,
+            recall_floor=settings.prefilter_recall_floor,
+            min_samples=settings.prefilter_min_samples,
+            shadow=settings.prefilter_shadow,
+        )
+    return HSAAgent(
         settings=settings,
         drive_client=drive_client,
-        sheets_client=sheets_client,
+        sheets_client=sheets_writer or sheets_client,
         dedup_store=dedup_store,
+        result_cache=result_cache,
+        prefilter=prefilter,
     )
 
-    # Lock so two monitors processing emails at the same time don't collide
-    agent_lock = threading.Lock()
+
+def close_agent(agent: HSAAgent) -> None:
+    """Flush buffered Sheet rows, release the agent's resources and log its stats."""
+    logger = get_logger(__name__)
+    agent.close()
+    if isinstance(agent.sheets_client, SheetsBatchWriter):
+        agent.sheets_client.close()
+    if agent.result_cache:
+        logger.info(f"Result cache: {agent.result_cache.stats()}")
+    logger.info(f"Claude rate limiter: {agent.limiter.stats()}")
+    if agent.cascade:
+        logger.info(f"Model cascade: {agent.cascade.stats()}")
+    if agent.prefilter:
+        logger.info(f"Pre-filter: {agent.prefilter.stats()}")
+
+
+def main() -> None:
+    # ── 1. Load config from .env ─────────────────────────────────────────────
+    settings = load_settings()
+    setup_logging(log_level=settings.log_level, log_file=settings.log_file or "")
+    logger = get_logger(__name__)
+    logger.info("HSA Tracker starting…")
+
+    # ── 2–4. Google clients and the agent ────────────────────────────────────
+    agent = build_agent(settings)
+    dedup_store = agent.dedup
+
+    # Fetched emails are persisted before processing, so failures and
+    # crashes are retried instead of lost
+    work_queue = None
+    if settings.work_queue_enabled:
+        work_queue = WorkQueue(
+            db_path=settings.dedup_db_path,
+            visibility_timeout=settings.work_queue_visibility_seconds,
+            max_attempts=settings.work_queue_max_attempts,
+        )
+
+    # Staged worker pools, so one slow render or Claude call doesn't stall
+    # every account
+    pipeline = Pipeline(
+        agent,
+        workers=settings.pipeline_workers,
+        queue_size=settings.pipeline_queue_size,
+        work_queue=work_queue,
+    )
+    pipeline.start()
 
     def on_message(message):
-        with agent_lock:
-            try:
-                agent.process(message)
-            except Exception as e:
-                logger.error(f"Unhandled error processing email: {e}", exc_info=True)
+        try:
+            pipeline.enqueue(message)
+        except Exception as e:
+            logger.error(f"Unhandled error queueing email: {e}", exc_info=True)
 
     # ── 5. Start one monitor per IMAP account ────────────────────────────────
+    sync_store = SyncStateStore(db_path=settings.dedup_db_path)
+    fetch_options = FetchOptions(
+        two_phase=settings.imap_two_phase_fetch,
+        dedup_store=dedup_store,
+        chunk_bytes=settings.imap_fetch_chunk_mb * 1024 * 1024,
+        max_message_bytes=settings.imap_max_message_mb * 1024 * 1024,
+    )
     monitors = []
-    for account in settings.imap_accounts:
-        if settings.monitor_mode == "idle":
-            monitor = IMAPMonitor(**account)
-        else:
-            monitor = PollingMonitor(
+    if settings.monitor_mode == "async":
+        # Every account on one asyncio event loop, in a single thread
+        monitor = AsyncIMAPMonitor(settings.imap_accounts, sync_store=sync_store, fetch_options=fetch_options)
+        thread = threading.Thread(target=monitor.start, args=(on_message,), daemon=True, name="monitor-async")
+        thread.start()
+        monitors.append(monitor)
+        for account in settings.imap_accounts:
+            logger.info(f"Monitoring [async]: {account['username']} / {account['mailbox']}")
+    else:
+        def polling_monitor(account):
+            scheduler = None
+            if settings.poll_adaptive:
+                scheduler = AdaptiveScheduler(
+                    f"{account['username']}@{account['host']}",
+                    min_seconds=settings.poll_min_seconds,
+                    max_seconds=settings.poll_max_seconds,
+                    start_seconds=settings.poll_interval_minutes * 60,
+                    store=sync_store,
+                )
+            return PollingMonitor(
                 **account,
                 interval_minutes=settings.poll_interval_minutes,
+                sync_store=sync_store,
+                fetch_options=fetch_options,
+                scheduler=scheduler,
             )
 
-        thread = threading.Thread(
-            target=monitor.start,
-            args=(on_message,),
-            daemon=True,
-            name=f"monitor-{account['username']}",
-        )
-        thread.start()
-        monitors.append(monitor)
-        logger.info(
-            f"Monitoring [{settings.monitor_mode}]: {account['username']} / {account['mailbox']}"
-        )
+        for account in settings.imap_accounts:
+            if settings.monitor_mode == "idle":
+                monitor = IMAPMonitor(
+                    **account,
+                    sync_store=sync_store,
+                    fetch_options=fetch_options,
+                    fallback=polling_monitor(account) if settings.idle_fallback_failures else None,
+                    max_idle_failures=settings.idle_fallback_failures,
+                )
+            else:
+                monitor = polling_monitor(account)
+
+            thread = threading.Thread(
+                target=monitor.start,
+                args=(on_message,),
+                daemon=True,
+                name=f"monitor-{account['username']}",
+            )
+            thread.start()
+            monitors.append(monitor)
+            logger.info(
+                f"Monitoring [{settings.monitor_mode}]: {account['username']} / {account['mailbox']}"
+            )
 
-    logger.info(f"Watching {len(monitors)} account(s). Press Ctrl+C to stop.")
+    logger.info(f"Watching {len(settings.imap_accounts)} account(s). Press Ctrl+C to stop.")
 
     # ── 6. Wait until Ctrl+C, then shut down cleanly ─────────────────────────
     def shutdown(sig, frame):
         logger.info("Shutting down…")
         for monitor in monitors:
             monitor.stop()
+        pipeline.stop()
+        close_agent(agent)
+        if work_queue:
+            logger.info(f"Work queue: {work_queue.stats()}")
+            work_queue.close()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, shutdown)
@@ -1,7 +1,7 @@
 from dataclasses import dataclass, field
 from datetime import date
 from decimal import Decimal
-from typing import Optional
+from typing import Any, Optional
 
 
 @dataclass
@@ -30,6 +30,7 @@ class HSAResult:
     is_hsa_eligible: bool
     confidence: float     # 0.0 – 1.0
     reason: str
+    parse_error: bool = False   # Claude's answer was unusable; the verdict is a default
 
 
 @dataclass
@@ -40,6 +41,28 @@ class ExtractedData:
     amount: Optional[Decimal]
 
 
+@dataclass
+class Capture:
+    """One document taken from an email, carried through the pipeline stages."""
+    content: bytes        # PDF or PNG bytes, uploaded to Drive (empty until rendered)
+    mime_type: str        # "application/pdf" or "image/png"
+    # What Claude sees instead of content, if set: (bytes, mime_type) parts,
+    # e.g. extracted text, a trimmed PDF, or the tiles of a tall screenshot
+    llm_parts: list[tuple[bytes, str]] = field(default_factory=list)
+    result: Optional[HSAResult] = None
+    extracted: Optional[ExtractedData] = None
+    drive_link: str = ""
+    # Which model tier ("fast" or "strong") answered each step, e.g. {"classify": "fast"}
+    tiers: dict[str, str] = field(default_factory=dict)
+    # Future of an extraction started before classification finished (speculative mode)
+    speculative: Any = None
+
+    @property
+    def payload(self) -> list[tuple[bytes, str]]:
+        """(bytes, mime_type) parts to send to Claude."""
+        return self.llm_parts or [(self.content, self.mime_type)]
+
+
 @dataclass
 class SheetRow:
     """One row written to the Google Sheet."""
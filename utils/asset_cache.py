@@ -0,0 +1,82 @@
+import hashlib
+import os
+import threading
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AssetCache:
+    """Disk-backed LRU cache of remote email assets (images, stylesheets), keyed by URL.
+
+    Marketing emails from the same sender reuse the same logos and banners,
+    so after the first render they are served from disk instead of the network.
+    Each entry is one file whose first line is the Content-Type. The least
+    recently used files are deleted once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 200 * 1024 * 1024):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def get(self, url: str) -> tuple[str, bytes] | None:
+        """Return (content_type, body) for a cached URL, or None."""
+        path = self._path(url)
+        try:
+            with open(path, "rb") as f:
+                content_type, _, body = f.read().partition(b"\n")
+            os.utime(path)   # mark as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content_type.decode("ascii", errors="replace"), body
+
+    def put(self, url: str, content_type: str, body: bytes) -> None:
+        """Store an asset, evicting least recently used entries if over budget."""
+        data = content_type.encode("ascii", errors="replace") + b"\n" + body
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._size += len(data) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used files until under budget. Caller holds the lock."""
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        removed = 0
+        for entry in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+            removed += 1
+        logger.debug(f"Asset cache evicted {removed} file(s); now {self._size} bytes")
+
+    def _entries(self) -> list[os.DirEntry]:
+        """Cached files, ignoring in-progress writes."""
+        return [
+            entry for entry in os.scandir(self.cache_dir)
+            if entry.is_file() and not entry.name.endswith(".tmp")
+        ]
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest())
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BackfillCheckpoint:
+    """SQLite-backed record of which source items a backfill has finished.
+
+    An item is a position in a source, e.g. an IMAP UID, an mbox entry or
+    an .eml file, so a resumed backfill skips finished items without
+    downloading or parsing them again. Items that failed are not recorded
+    and are retried by the next run.
+
+    Lives in the same SQLite file as DedupStore. Safe to share between threads.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self._create_table()
+
+    def _create_table(self) -> None:
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_checkpoint (
+                item_key     TEXT PRIMARY KEY,
+                message_id   TEXT NOT NULL,
+                done_at      TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def done_keys(self, prefix: str) -> set[str]:
+        """Every finished item key starting with `prefix`."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT item_key FROM backfill_checkpoint WHERE item_key >= ? AND item_key < ?",
+                (prefix, prefix + "￿"),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_done(self, item_key: str, message_id: str) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO backfill_checkpoint (item_key, message_id, done_at) VALUES (?, ?, ?)",
+                (item_key, message_id, datetime.utcnow().isoformat()),
+            )
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+EVICT_EVERY_N_PUTS = 50
+
+
+class ResultCache:
+    """SQLite-backed cache of Claude answers, keyed by document content.
+
+    Billing systems often send the same PDF several times (statement,
+    reminder, past-due notice) under different Message-IDs. The key is a
+    hash of the document bytes plus the model and prompt, so an identical
+    document skips the Claude call while a model or prompt change misses.
+
+    Entries older than max_age_days are dropped, and the least recently used
+    entries are dropped once there are more than max_entries. Lives in the
+    same SQLite file as DedupStore, in its own table.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 5000, max_age_days: int = 90):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._create_table()
+
+    def _create_table(self) -> None:
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS result_cache (
+                cache_key    TEXT PRIMARY KEY,
+                value        TEXT NOT NULL,
+                created_at   TEXT NOT NULL,
+                last_used_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(kind: str, model: str, prompt: str, parts: list[tuple[bytes, str]]) -> str:
+        """Build a cache key from everything that affects Claude's answer.
+
+        `parts` are the (bytes, mime_type) pairs sent as the document.
+        """
+        prompt_version = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        digest = hashlib.sha256()
+        for content, mime_type in parts:
+            digest.update(mime_type.encode("utf-8") + b"\0")
+            digest.update(hashlib.sha256(content).digest())
+        return f"{kind}:{model}:{prompt_version}:{digest.hexdigest()}"
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached answer for this key, or None on a miss or an expired entry."""
+        cutoff = (datetime.utcnow() - timedelta(days=self.max_age_days)).isoformat()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, created_at FROM result_cache WHERE cache_key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None and row[1] < cutoff:
+                # Expired but not evicted yet
+                self.conn.execute("DELETE FROM result_cache WHERE cache_key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE result_cache SET last_used_at = ? WHERE cache_key = ?",
+                (datetime.utcnow().isoformat(), key),
+            )
+            self.conn.commit()
+        logger.debug(f"Result cache hit: {key} ({self.hits} hits / {self.misses} misses)")
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict) -> None:
+        """Store Claude's parsed answer under this key."""
+        now = datetime.utcnow().isoformat()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO result_cache (cache_key, value, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self.conn.commit()
+            self._puts += 1
+            if self._puts % EVICT_EVERY_N_PUTS == 0:
+                self._evict()
+
+    def stats(self) -> dict:
+        """Hit/miss counters since startup."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _evict(self) -> None:
+        """Drop expired entries, then the least recently used beyond max_entries.
+        Caller must hold the lock."""
+        cutoff = (datetime.utcnow() - timedelta(days=self.max_age_days)).isoformat()
+        expired = self.conn.execute(
+            "DELETE FROM result_cache WHERE created_at < ?",
+            (cutoff,),
+        ).rowcount
+        overflow = self.conn.execute(
+            "DELETE FROM result_cache WHERE cache_key NOT IN ("
+            "  SELECT cache_key FROM result_cache ORDER BY last_used_at DESC LIMIT ?"
+            ")",
+            (self.max_entries,),
+        ).rowcount
+        self.conn.commit()
+        if expired or overflow:
+            logger.info(f"Result cache evicted {expired} expired and {overflow} least-recently-used entries")
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
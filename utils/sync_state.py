@@ -0,0 +1,85 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SyncStateStore:
+    """SQLite-backed store of each mailbox's UIDVALIDITY and the highest UID
+    already handed to the agent, so monitors only fetch mail above it.
+    Also keeps each account's arrivals per hour of day for AdaptiveScheduler.
+
+    Lives in the same SQLite file as DedupStore, in its own table. Safe to
+    share between monitor threads."""
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self._create_table()
+
+    def _create_table(self) -> None:
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS imap_sync_state (
+                account      TEXT NOT NULL,
+                mailbox      TEXT NOT NULL,
+                uidvalidity  INTEGER NOT NULL,
+                last_uid     INTEGER NOT NULL,
+                updated_at   TEXT NOT NULL,
+                PRIMARY KEY (account, mailbox)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS imap_arrival_stats (
+                account      TEXT PRIMARY KEY,
+                hourly       TEXT NOT NULL,
+                updated_at   TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, account: str, mailbox: str) -> Optional[tuple[int, int]]:
+        """Return (uidvalidity, last_uid) for a mailbox, or None if never synced."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT uidvalidity, last_uid FROM imap_sync_state WHERE account = ? AND mailbox = ?",
+                (account, mailbox),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, account: str, mailbox: str, uidvalidity: int, last_uid: int) -> None:
+        """Record the highest UID handed to the agent for this mailbox."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO imap_sync_state (account, mailbox, uidvalidity, last_uid, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (account, mailbox, uidvalidity, last_uid, datetime.utcnow().isoformat()),
+            )
+            self.conn.commit()
+        logger.debug(f"Sync watermark for {account}/{mailbox}: UID {last_uid}")
+
+    def get_arrivals(self, account: str) -> Optional[list[float]]:
+        """Return the account's learned arrivals per hour of day, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT hourly FROM imap_arrival_stats WHERE account = ?", (account,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_arrivals(self, account: str, hourly: list[float]) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO imap_arrival_stats (account, hourly, updated_at) VALUES (?, ?, ?)",
+                (account, json.dumps([round(count, 3) for count in hourly]), datetime.utcnow().isoformat()),
+            )
+            self.conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,259 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Optional
+
+from models.data_models import Attachment, EmailMessage
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class WorkItem:
+    """One claimed email, with whatever its earlier attempts checkpointed."""
+    id: int
+    message: EmailMessage
+    attempts: int
+    stage: str = ""
+    # Side effects already done, so a retry doesn't repeat them,
+    # keyed by agent.pipeline.capture_key, e.g.
+    # {"uploaded": {"pdf:3f2a…": "https://drive…"}, "logged": ["pdf:3f2a…"]}
+    state: dict = field(default_factory=dict)
+
+
+class WorkQueue:
+    """SQLite-backed queue of emails between the monitors and the pipeline.
+
+    Monitors enqueue each fetched email before anything else happens to it,
+    so once the IMAP watermark moves past a message it is already on disk.
+    Workers claim items with a visibility timeout, renewed at every
+    checkpoint: an item that is neither completed, failed nor checkpointed
+    before the timeout (the process died) becomes claimable again. Delivery is at-least-once; the dedup store and the
+    per-item checkpoints keep repeats from uploading or logging twice.
+
+    A failed item is retried after an exponential backoff. After
+    `max_attempts` it moves to the dead_letters table with its last error.
+
+    Lives in the same SQLite file as DedupStore. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        visibility_timeout: float = 15 * 60,
+        max_attempts: int = 5,
+        backoff_seconds: float = 60,
+        max_backoff_seconds: float = 6 * 60 * 60,
+    ):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._lock = threading.Lock()
+        self._create_tables()
+
+    def _create_tables(self) -> None:
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS work_queue (
+                id            INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id    TEXT NOT NULL UNIQUE,
+                payload       TEXT NOT NULL,
+                stage         TEXT NOT NULL DEFAULT '',
+                state         TEXT NOT NULL DEFAULT '{}',
+                attempts      INTEGER NOT NULL DEFAULT 0,
+                available_at  REAL NOT NULL,
+                claimed_until REAL NOT NULL DEFAULT 0,
+                last_error    TEXT NOT NULL DEFAULT '',
+                created_at    TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                message_id    TEXT PRIMARY KEY,
+                payload       TEXT NOT NULL,
+                stage         TEXT NOT NULL,
+                attempts      INTEGER NOT NULL,
+                last_error    TEXT NOT NULL,
+                failed_at     TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_work_queue_available ON work_queue (available_at)")
+        self.conn.commit()
+
+    def enqueue(self, message: EmailMessage) -> bool:
+        """Persist an email for processing. Returns False if it is already queued."""
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO work_queue (message_id, payload, available_at, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (message.message_id, _encode_message(message), time.time(), datetime.utcnow().isoformat()),
+            )
+            self.conn.commit()
+        if cursor.rowcount:
+            logger.debug(f"Enqueued: {message.message_id}")
+        return bool(cursor.rowcount)
+
+    def claim(self) -> Optional[WorkItem]:
+        """Take the oldest available item for one visibility timeout, or None."""
+        now = time.time()
+        with self._lock:
+            while True:
+                row = self.conn.execute(
+                    "SELECT id, payload, stage, state, attempts FROM work_queue "
+                    "WHERE available_at <= ? AND claimed_until <= ? ORDER BY available_at, id LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[4] < self.max_attempts:
+                    break
+                # Claimed max_attempts times without ever completing or failing:
+                # it takes the process down with it, so stop retrying
+                self._dead_letter(row[0], f"abandoned {row[4]} time(s) without finishing")
+                logger.error(f"Dead-lettered work item {row[0]} after {row[4]} unfinished attempt(s)")
+            self.conn.execute(
+                "UPDATE work_queue SET claimed_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (now + self.visibility_timeout, row[0]),
+            )
+            self.conn.commit()
+        return WorkItem(
+            id=row[0],
+            message=_decode_message(row[1]),
+            attempts=row[4] + 1,
+            stage=row[2],
+            state=json.loads(row[3]),
+        )
+
+    def checkpoint(self, item: WorkItem, stage: str) -> None:
+        """Record the stage an item has reached and its side-effect state.
+
+        Also renews the claim for another visibility timeout, so an item
+        that is still making progress is never claimed a second time.
+        """
+        item.stage = stage
+        with self._lock:
+            self.conn.execute(
+                "UPDATE work_queue SET stage = ?, state = ?, claimed_until = ? WHERE id = ?",
+                (stage, json.dumps(item.state), time.time() + self.visibility_timeout, item.id),
+            )
+            self.conn.commit()
+
+    def release(self, item: WorkItem) -> None:
+        """Hand back a claim that found the item still being processed.
+
+        The attempt isn't counted, and the item stays hidden for another
+        visibility timeout while the earlier claim finishes it.
+        """
+        with self._lock:
+            self.conn.execute(
+                "UPDATE work_queue SET attempts = MAX(attempts - 1, 0), claimed_until = ? WHERE id = ?",
+                (time.time() + self.visibility_timeout, item.id),
+            )
+            self.conn.commit()
+
+    def complete(self, item: WorkItem) -> None:
+        """Remove a finished item."""
+        with self._lock:
+            self.conn.execute("DELETE FROM work_queue WHERE id = ?", (item.id,))
+            self.conn.commit()
+
+    def fail(self, item: WorkItem, error: str) -> None:
+        """Schedule a retry after backoff, or dead-letter the item once it is out of attempts."""
+        with self._lock:
+            if item.attempts >= self.max_attempts:
+                self._dead_letter(item.id, error)
+                logger.error(
+                    f"Giving up on '{item.message.subject}' after {item.attempts} attempt(s) "
+                    f"at stage {item.stage or 'capture'}: {error}"
+                )
+                return
+
+            delay = min(self.backoff_seconds * 2 ** (item.attempts - 1), self.max_backoff_seconds)
+            self.conn.execute(
+                "UPDATE work_queue SET available_at = ?, claimed_until = 0, last_error = ? WHERE id = ?",
+                (time.time() + delay, error, item.id),
+            )
+            self.conn.commit()
+        logger.warning(
+            f"Attempt {item.attempts}/{self.max_attempts} for '{item.message.subject}' failed "
+            f"at stage {item.stage or 'capture'} — retrying in {delay:.0f}s: {error}"
+        )
+
+    def _dead_letter(self, item_id: int, error: str) -> None:
+        """Move an item to dead_letters. Caller holds the lock."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO dead_letters (message_id, payload, stage, attempts, last_error, failed_at) "
+            "SELECT message_id, payload, stage, attempts, ?, ? FROM work_queue WHERE id = ?",
+            (error, datetime.utcnow().isoformat(), item_id),
+        )
+        self.conn.execute("DELETE FROM work_queue WHERE id = ?", (item_id,))
+        self.conn.commit()
+
+    def recover(self) -> int:
+        """Release every claim left by a previous run, so its items are picked up now.
+
+        Only call this at startup, before any worker has claimed anything.
+        """
+        with self._lock:
+            cursor = self.conn.execute("UPDATE work_queue SET claimed_until = 0 WHERE claimed_until > 0")
+            self.conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Resuming {cursor.rowcount} email(s) interrupted by the last shutdown")
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = self.conn.execute("SELECT COUNT(*) FROM work_queue").fetchone()[0]
+            dead = self.conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        return {"pending": pending, "dead_letters": dead}
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+def _encode_message(message: EmailMessage) -> str:
+    return json.dumps({
+        "message_id": message.message_id,
+        "from_address": message.from_address,
+        "subject": message.subject,
+        "date": message.date.isoformat(),
+        "body_html": message.body_html,
+        "body_text": message.body_text,
+        "attachments": [
+            {
+                "filename": attachment.filename,
+                "mime_type": attachment.mime_type,
+                "content": base64.b64encode(attachment.content).decode("ascii"),
+            }
+            for attachment in message.attachments
+        ],
+    })
+
+
+def _decode_message(payload: str) -> EmailMessage:
+    data = json.loads(payload)
+    return EmailMessage(
+        message_id=data["message_id"],
+        from_address=data["from_address"],
+        subject=data["subject"],
+        date=date.fromisoformat(data["date"]),
+        body_html=data["body_html"],
+        body_text=data["body_text"],
+        attachments=[
+            Attachment(
+                filename=attachment["filename"],
+                mime_type=attachment["mime_type"],
+                content=base64.b64decode(attachment["content"]),
+            )
+            for attachment in data["attachments"]
+        ],
+    )